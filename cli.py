@@ -4,13 +4,18 @@ from ops import (
     add_default_relay, swap_default_relays, remove_default_relay,
     print_defaults, handle_up, handle_down, check_relay_status, 
     update_database, fetch_relay_info, query_database, print_query_results,
-    move_default_relay
+    move_default_relay, run_batch, print_summary, SUMMARY_VIEWS,
+    run_watchdog
 )
 
+ENGINES = ['wg-quick', 'native']
+FAMILIES = ['auto', '4', '6']
+
 def build_parser():
 
     # Initialize the argument parser and Subparser
     parser = argparse.ArgumentParser(description="mull")
+    parser.add_argument('--trace', action='store_true', help="Print query cache hit/miss statistics to stderr")
 
     ## ---------- Subcommands ----------- ##
 
@@ -22,13 +27,27 @@ def build_parser():
     up_relay_group.add_argument('relay', type=str, nargs='?', help="Relay hostname to activate")
     up_relay_group.add_argument('-r', '--results', type=int, metavar='N', help="Use relay at index N from query results")
     up_parser.add_argument('-v', '--verbose', action='store_true', help='Enable output from wg-quick')
+    up_parser.add_argument('-e', '--engine', choices=ENGINES, default='wg-quick', help="Interface setup: wg-quick script or native ip/wg calls (default: wg-quick)")
+    up_parser.add_argument('--family', choices=FAMILIES, help="Endpoint address family: race IPv4/IPv6 and use the faster (auto), or force one (default: config's endpoint)")
     up_parser.set_defaults(func=handle_up, action='up')
 
     # 'down' subcommand to deactivate the relay
     down_parser = subparsers.add_parser('down', help="Deactivate relay")
     down_parser.add_argument('-v', '--verbose', action='store_true', help='Enable output from wg-quick')
+    down_parser.add_argument('-e', '--engine', choices=ENGINES, default='wg-quick', help="Interface teardown: wg-quick script or native ip/wg calls (default: wg-quick)")
     down_parser.set_defaults(func=handle_down, action='down')
 
+    # 'watchdog' subcommand to monitor the active relay and reconnect when it stops passing traffic
+    watchdog_parser = subparsers.add_parser('watchdog', help="Monitor active relay and reconnect when it goes stale")
+    watchdog_parser.add_argument('-s', '--source', choices=['defaults', 'results'], default='defaults', help="Relays to fail over to (default: defaults)")
+    watchdog_parser.add_argument('--interval', type=float, default=2, metavar='S', help="Seconds between checks (default: 2)")
+    watchdog_parser.add_argument('--stale', type=float, default=180, metavar='S', help="Max handshake age in seconds (default: 180)")
+    watchdog_parser.add_argument('--stall', type=float, default=10, metavar='S', help="Max seconds without received traffic (default: 10)")
+    watchdog_parser.add_argument('--handshake-timeout', type=float, default=5, metavar='S', help="Seconds to wait for a new relay's first handshake (default: 5)")
+    watchdog_parser.add_argument('--force', action='store_true', help="Reconnect even when torrenting is detected")
+    watchdog_parser.add_argument('-e', '--engine', choices=ENGINES, default='wg-quick', help="Engine used to reconnect (default: wg-quick)")
+    watchdog_parser.set_defaults(func=run_watchdog)
+
     # 'add' subcommand to add a new relay to the default relay list either by appending or inserting at pos <idx>
     add_parser = subparsers.add_parser('add', help="Add relay hostname to default relays list", aliases=['a'])
     add_relay_group = add_parser.add_mutually_exclusive_group(required=True)
@@ -79,6 +98,17 @@ def build_parser():
     status_parser.add_argument('-v', '--verbose', action='store_true', help="Print additional relay data")
     status_parser.set_defaults(func=check_relay_status)
 
+    # 'summary' subcommand to print precomputed relay counts per country, city or provider
+    summary_parser = subparsers.add_parser('summary', help="Relay counts and port speed per country, city or provider")
+    summary_parser.add_argument('-b', '--by', choices=list(SUMMARY_VIEWS), default='country', help="Grouping (default: country)")
+    summary_parser.add_argument('-f', '--format', choices=['table', 'csv', 'json'], default='table', help="Output format (default: table)")
+    summary_parser.set_defaults(func=print_summary)
+
+    # 'batch' subcommand to run many subcommands in one process
+    batch_parser = subparsers.add_parser('batch', help="Run subcommands from a file (or stdin), one per line")
+    batch_parser.add_argument('file', type=argparse.FileType('r'), nargs='?', default='-', help="Command file, `-` for stdin (default)")
+    batch_parser.set_defaults(func=run_batch)
+
     # 'query' subcommand to query the database
     query_parser = subparsers.add_parser('query', help="Query database, see `query -h` for options", aliases=["q"])
     
@@ -99,6 +129,8 @@ def build_parser():
         flags = options.pop("flags")
         query_parser.add_argument(*flags, **options)
 
+    query_parser.add_argument('--sort', choices=['reliability'], help="Sort results by observed session reliability (most reliable first)")
+
     # Set defaults
     query_parser.set_defaults(func=query_database)
 
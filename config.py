@@ -1,13 +1,85 @@
 """
 Handles configuration loading and shared constants for mull-cli.
 """
+from contextlib import contextmanager
 import configparser
+import tempfile
+import fcntl
 import os
 
 BASE_DIR    = os.path.dirname(os.path.abspath(__file__))
 CONFIG_PATH = os.path.join(BASE_DIR, 'defaults.conf')
+LOCK_PATH   = os.path.join(BASE_DIR, '.defaults.conf.lock')
 CONFIG      = configparser.ConfigParser()
-CONFIG.read(CONFIG_PATH)
+
+
+## ------------- LOCKED / ATOMIC CONF ACCESS ------------- ##
+
+_LOCK_FILE  = None
+_LOCK_DEPTH = 0
+_CONF_STAMP = None  # (inode, mtime_ns, size) of defaults.conf when CONFIG was last read or written
+
+def _stat_conf():
+    """Returns a stamp identifying the current defaults.conf on disk (None if missing)."""
+    try:
+        st = os.stat(CONFIG_PATH)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+@contextmanager
+def defaults_lock():
+    """Holds an exclusive advisory lock on defaults.conf, re-entrant within one process."""
+    global _LOCK_FILE, _LOCK_DEPTH
+    if _LOCK_DEPTH == 0:
+        _LOCK_FILE = open(LOCK_PATH, 'a')
+        fcntl.flock(_LOCK_FILE, fcntl.LOCK_EX)
+    _LOCK_DEPTH += 1
+    try:
+        yield
+    finally:
+        _LOCK_DEPTH -= 1
+        if _LOCK_DEPTH == 0:
+            fcntl.flock(_LOCK_FILE, fcntl.LOCK_UN)
+            _LOCK_FILE.close()
+            _LOCK_FILE = None
+
+def conf_changed():
+    """True if defaults.conf was replaced or modified since CONFIG was last read or written."""
+    return _stat_conf() != _CONF_STAMP
+
+def reload_config():
+    """Re-reads defaults.conf into CONFIG, dropping sections that are no longer on disk."""
+    global _CONF_STAMP
+    for section in CONFIG.sections():
+        CONFIG.remove_section(section)
+    _CONF_STAMP = _stat_conf()
+    CONFIG.read(CONFIG_PATH)
+
+def write_config(config):
+    """Writes config to defaults.conf through a temp file + rename, so readers never see a partial file."""
+    global _CONF_STAMP
+    try:
+        mode = os.stat(CONFIG_PATH).st_mode & 0o777
+    except FileNotFoundError:
+        mode = 0o644
+    with tempfile.NamedTemporaryFile('w', dir=BASE_DIR, prefix='.defaults.', delete=False) as tmp:
+        config.write(tmp)
+        tmp.flush()
+        os.fsync(tmp.fileno())
+    os.chmod(tmp.name, mode)
+    os.replace(tmp.name, CONFIG_PATH)
+    _CONF_STAMP = _stat_conf()
+
+def read_default_relays():
+    """Returns the default relays list from CONFIG."""
+    try:
+        return list(dict(CONFIG['RELAYS']).values())
+    except KeyError:
+        return []
+
+
+reload_config()
 
 
 # DATABASE INIT / UPDATE SCRIPT PATH
@@ -15,33 +87,36 @@ INIT_DB_PATH = os.path.join(BASE_DIR, 'init_db.py')
 
 
 # DATABASE PATH - one will be created if not found
-try: 
+try:
     DATABASE_PATH = CONFIG['DATABASE']['relay_database_path']
     DATABASE_PATH = os.path.join(BASE_DIR, DATABASE_PATH)
-except: 
+except:
     print("[config.py] Database path not found in `defaults.conf`")
     DATABASE_PATH = os.path.join(BASE_DIR, 'relays.db')
     print(f"[config.py] creating database path at {DATABASE_PATH}")  # maybe move this to the after writing
 
-    # Create section if it doesn't exist
-    if not CONFIG.has_section("DATABASE"):
-        CONFIG.add_section("DATABASE")
+    with defaults_lock():
+        # Pick up anything written by another process since we read the file
+        reload_config()
+
+        # Create section if it doesn't exist
+        if not CONFIG.has_section("DATABASE"):
+            CONFIG.add_section("DATABASE")
+
+        # Add keys and values to the new section
+        CONFIG.set("DATABASE", "relay_database_path", "relays.db")
 
-    # Add keys and values to the new section
-    CONFIG.set("DATABASE", "relay_database_path", "relays.db")
-    
-    # Update configuration file
-    with open(CONFIG_PATH, 'w') as configfile:
-        CONFIG.write(configfile)  
+        # Update configuration file
+        write_config(CONFIG)
         print(f"[config.py] Added 'DATABASE' section to {CONFIG_PATH}")
 
 
+# COLUMNAR READ SNAPSHOT - written next to the database by init_db.py
+SNAPSHOT_PATH = f"{os.path.splitext(DATABASE_PATH)[0]}.snap"
+
+
 # DEFAULT RELAYS
-try:
-    relays         = dict(CONFIG['RELAYS'])
-    DEFAULT_RELAYS = list(relays.values())
-except:
-    DEFAULT_RELAYS = []
+DEFAULT_RELAYS = read_default_relays()
 
 
 # TORRENT SOFTWARE
@@ -53,4 +128,12 @@ except:
 
 
 # QUERY RESULTS
-QUERY_RESULTS_FILE_PATH = os.path.join(BASE_DIR, 'query_results.txt')
\ No newline at end of file
+QUERY_RESULTS_FILE_PATH = os.path.join(BASE_DIR, 'query_results.txt')
+
+
+# WATCHDOG RECOVERY LOG
+WATCHDOG_LOG_PATH = os.path.join(BASE_DIR, 'watchdog.log')
+
+
+# QUERY RESULT CACHE - see query_cache.py
+QUERY_CACHE_DIR = os.path.join(BASE_DIR, '.query_cache')
@@ -0,0 +1,56 @@
+"""
+Happy-eyeballs style race between a relay's IPv4 and IPv6 addresses.
+
+Both families get a non-blocking TCP connect at the same moment; the first one to
+answer wins. A refused connection (RST) counts as an answer too, since it proves the
+path works and takes exactly one round trip. WireGuard itself is UDP and silent to
+unauthenticated packets, so a TCP probe is the cheapest RTT measurement available
+before the tunnel is up.
+"""
+import selectors
+import socket
+import errno
+import time
+
+PROBE_PORT   = 443
+RACE_TIMEOUT = 0.5   # seconds, after which the config's endpoint is kept
+
+_FAMILIES  = {4: socket.AF_INET, 6: socket.AF_INET6}
+_ANSWERED  = (0, errno.ECONNREFUSED)
+
+
+def race(addresses, port=PROBE_PORT, timeout=RACE_TIMEOUT):
+    """
+    Races `addresses` ({4: "a.b.c.d", 6: "x::y"}) and returns (family, rtt_seconds)
+    for the first family to answer, or None if none answered within `timeout`.
+    """
+    selector = selectors.DefaultSelector()
+    sockets  = []
+    start    = time.monotonic()
+    try:
+        for family, address in addresses.items():
+            try:
+                sock = socket.socket(_FAMILIES[family], socket.SOCK_STREAM)
+            except OSError:
+                continue   # family not available on this host
+            sockets.append(sock)
+            sock.setblocking(False)
+            err = sock.connect_ex((address, port))
+            if err in _ANSWERED:
+                return family, time.monotonic() - start
+            if err == errno.EINPROGRESS:
+                selector.register(sock, selectors.EVENT_WRITE, family)
+
+        while selector.get_map():
+            remaining = timeout - (time.monotonic() - start)
+            if remaining <= 0:
+                break
+            for key, _ in selector.select(remaining):
+                if key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) in _ANSWERED:
+                    return key.data, time.monotonic() - start
+                selector.unregister(key.fileobj)   # unreachable over this family
+        return None
+    finally:
+        selector.close()
+        for sock in sockets:
+            sock.close()
@@ -6,7 +6,9 @@ import sqlite3
 import json
 import os
 
-from config import CONFIG, BASE_DIR, DATABASE_PATH
+from config import CONFIG, BASE_DIR, DATABASE_PATH, SNAPSHOT_PATH
+from migrations import migrate, refresh_summaries
+from snapshot import write_snapshot
 
 ## -----------  RETRIEVE DATA FROM MULLVAD ----------- ##
 
@@ -30,30 +32,12 @@ data = [relay for relay in data if relay['type'] == 'wireguard']
 conn   = sqlite3.connect(DATABASE_PATH)  
 cursor = conn.cursor()
 
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS relays (
-    hostname TEXT PRIMARY KEY,
-    country_code TEXT,
-    country_name TEXT,
-    city_code TEXT,
-    city_name TEXT,
-    fqdn TEXT,
-    active INTEGER CHECK(active IN (0, 1)),
-    owned INTEGER CHECK(owned IN (0, 1)),
-    provider TEXT,
-    ipv4_addr_in TEXT,
-    ipv6_addr_in TEXT,
-    network_port_speed INTEGER,
-    stboot INTEGER CHECK(stboot IN (0, 1)),
-    pubkey TEXT,
-    multihop_port INTEGER,
-    socks_name TEXT,
-    socks_port INTEGER,
-    daita INTEGER CHECK(daita IN (0, 1)),
-    type TEXT CHECK(type IN ('wireguard')),
-    status_messages TEXT
-)
-''')
+# Drop the read snapshot first, a failed refresh must not leave it out of sync with the database
+if os.path.exists(SNAPSHOT_PATH):
+    os.remove(SNAPSHOT_PATH)
+
+# Create tables on first run, upgrade older databases in place
+migrate(conn)
 
 ## -----------  PREPARE DATA FOR DATABASE ----------- ##
 
@@ -98,19 +82,38 @@ relay_data = [
     for relay in data
 ]
 
+# Insert in primary key order, keeps the WITHOUT ROWID b-tree pages densely packed
+relay_data.sort(key=lambda relay: relay["hostname"])
+
 ## -----------  INSERT DATA INTO DATABASE  ----------- ##
 
+# Lookup tables first, names are refreshed in case Mullvad renames a location
+cursor.executemany("""
+    INSERT INTO countries (country_code, country_name)
+    VALUES (:country_code, :country_name)
+    ON CONFLICT(country_code) DO UPDATE SET country_name = excluded.country_name
+""", relay_data)
+
+cursor.executemany("""
+    INSERT INTO cities (country_id, city_code, city_name)
+    SELECT country_id, :city_code, :city_name
+    FROM countries
+    WHERE country_code = :country_code
+    ON CONFLICT(country_id, city_code) DO UPDATE SET city_name = excluded.city_name
+""", relay_data)
+
 cursor.executemany("""
-    INSERT OR REPLACE INTO relays (
+    INSERT OR IGNORE INTO providers (provider) VALUES (:provider)
+""", [relay for relay in relay_data if relay["provider"] is not None])
+
+cursor.executemany("""
+    INSERT OR REPLACE INTO relay_data (
         hostname,
-        country_code,
-        country_name,
-        city_code,
-        city_name,
+        city_id,
+        provider_id,
         fqdn,
         active,
         owned,
-        provider,
         ipv4_addr_in,
         ipv6_addr_in,
         network_port_speed,
@@ -124,14 +127,13 @@ cursor.executemany("""
         status_messages
     ) VALUES (
         :hostname,
-        :country_code,
-        :country_name,
-        :city_code,
-        :city_name,
+        (SELECT ci.city_id
+         FROM cities ci JOIN countries co ON co.country_id = ci.country_id
+         WHERE co.country_code = :country_code AND ci.city_code = :city_code),
+        (SELECT provider_id FROM providers WHERE provider = :provider),
         :fqdn,
         :active,
         :owned,
-        :provider,
         :ipv4_addr_in,
         :ipv6_addr_in,
         :network_port_speed,
@@ -146,6 +148,19 @@ cursor.executemany("""
     )
 """, relay_data)
 
+# Materialize per country / city / provider aggregates for `mull summary`
+refresh_summaries(cursor)
+
+# New database generation, invalidates cached `query` results (see query_cache.py)
+cursor.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+
 ## -----------  COMMIT & CLOSE ----------- ##
 conn.commit()
+
+# Refresh planner statistics so filters on the lookup tables use the relay_data_city index
+cursor.execute("ANALYZE")
+conn.commit()
+
+# Columnar snapshot for the read-only query path (see snapshot.py)
+write_snapshot(conn, SNAPSHOT_PATH)
 conn.close()
\ No newline at end of file
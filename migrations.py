@@ -0,0 +1,304 @@
+"""
+Versioned schema migrations for the relay database.
+
+The schema version is stored in `PRAGMA user_version`. Migration N (1-based
+position in `MIGRATIONS`) upgrades a database from version N-1 to N. Each
+migration runs in its own transaction together with the version bump, so a
+failed migration leaves the database at the previous version.
+
+To change the schema, append a new function to `MIGRATIONS`, never edit one
+that has already shipped.
+"""
+
+
+## ------------- MIGRATIONS ------------- ##
+
+def _execute_script(cur, script):
+    """Runs `;`-separated statements one by one (`executescript` would commit the open transaction)."""
+    for statement in script.split(';'):
+        if statement.strip():
+            cur.execute(statement)
+
+
+def _create_relays_table(cur):
+    """v1: original flat `relays` table (what init_db.py created before migrations existed)."""
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS relays (
+        hostname TEXT PRIMARY KEY,
+        country_code TEXT,
+        country_name TEXT,
+        city_code TEXT,
+        city_name TEXT,
+        fqdn TEXT,
+        active INTEGER CHECK(active IN (0, 1)),
+        owned INTEGER CHECK(owned IN (0, 1)),
+        provider TEXT,
+        ipv4_addr_in TEXT,
+        ipv6_addr_in TEXT,
+        network_port_speed INTEGER,
+        stboot INTEGER CHECK(stboot IN (0, 1)),
+        pubkey TEXT,
+        multihop_port INTEGER,
+        socks_name TEXT,
+        socks_port INTEGER,
+        daita INTEGER CHECK(daita IN (0, 1)),
+        type TEXT CHECK(type IN ('wireguard')),
+        status_messages TEXT
+    )
+    ''')
+
+
+def _normalize_relays(cur):
+    """
+    v2: move countries, cities and providers into lookup tables, store relays in a
+    WITHOUT ROWID table keyed on hostname and replace `relays` with a view that
+    exposes the original columns (same names, same order), so existing queries
+    keep working unchanged.
+    """
+    _execute_script(cur, '''
+    CREATE TABLE countries (
+        country_id INTEGER PRIMARY KEY,
+        country_code TEXT NOT NULL UNIQUE,
+        country_name TEXT NOT NULL
+    );
+
+    CREATE TABLE cities (
+        city_id INTEGER PRIMARY KEY,
+        country_id INTEGER NOT NULL REFERENCES countries(country_id),
+        city_code TEXT NOT NULL,
+        city_name TEXT NOT NULL,
+        UNIQUE (country_id, city_code)
+    );
+
+    CREATE TABLE providers (
+        provider_id INTEGER PRIMARY KEY,
+        provider TEXT NOT NULL UNIQUE
+    );
+
+    CREATE TABLE relay_data (
+        hostname TEXT PRIMARY KEY,
+        city_id INTEGER NOT NULL REFERENCES cities(city_id),
+        provider_id INTEGER REFERENCES providers(provider_id),
+        fqdn TEXT,
+        active INTEGER CHECK(active IN (0, 1)),
+        owned INTEGER CHECK(owned IN (0, 1)),
+        ipv4_addr_in TEXT,
+        ipv6_addr_in TEXT,
+        network_port_speed INTEGER,
+        stboot INTEGER CHECK(stboot IN (0, 1)),
+        pubkey TEXT,
+        multihop_port INTEGER,
+        socks_name TEXT,
+        socks_port INTEGER,
+        daita INTEGER CHECK(daita IN (0, 1)),
+        type TEXT CHECK(type IN ('wireguard')),
+        status_messages TEXT
+    ) WITHOUT ROWID;
+
+    -- Location filters resolve through the lookup tables first, then fetch relays by city
+    CREATE INDEX relay_data_city ON relay_data(city_id);
+
+    -- Carry over rows from the flat table
+    INSERT INTO countries (country_code, country_name)
+    SELECT country_code, MAX(country_name) FROM relays GROUP BY country_code;
+
+    INSERT INTO cities (country_id, city_code, city_name)
+    SELECT co.country_id, r.city_code, MAX(r.city_name)
+    FROM relays r JOIN countries co ON co.country_code = r.country_code
+    GROUP BY co.country_id, r.city_code;
+
+    INSERT INTO providers (provider)
+    SELECT DISTINCT provider FROM relays WHERE provider IS NOT NULL;
+
+    INSERT INTO relay_data
+    SELECT r.hostname, ci.city_id, p.provider_id, r.fqdn, r.active, r.owned,
+           r.ipv4_addr_in, r.ipv6_addr_in, r.network_port_speed, r.stboot, r.pubkey,
+           r.multihop_port, r.socks_name, r.socks_port, r.daita, r.type, r.status_messages
+    FROM relays r
+    JOIN countries co ON co.country_code = r.country_code
+    JOIN cities ci    ON ci.country_id = co.country_id AND ci.city_code = r.city_code
+    LEFT JOIN providers p ON p.provider = r.provider;
+
+    DROP TABLE relays;
+
+    CREATE VIEW relays AS
+    SELECT r.hostname, co.country_code, co.country_name, ci.city_code, ci.city_name,
+           r.fqdn, r.active, r.owned, p.provider, r.ipv4_addr_in, r.ipv6_addr_in,
+           r.network_port_speed, r.stboot, r.pubkey, r.multihop_port, r.socks_name,
+           r.socks_port, r.daita, r.type, r.status_messages
+    FROM relay_data r
+    JOIN cities ci    ON ci.city_id = r.city_id
+    JOIN countries co ON co.country_id = ci.country_id
+    LEFT JOIN providers p ON p.provider_id = r.provider_id;
+    ''')
+
+
+def _create_summary_tables(cur):
+    """v3: aggregate tables behind `mull summary`, rebuilt by `refresh_summaries` on every update."""
+    _execute_script(cur, '''
+    CREATE TABLE summary_country (
+        country_code TEXT PRIMARY KEY,
+        country_name TEXT,
+        relays INTEGER,
+        active INTEGER,
+        owned INTEGER,
+        daita INTEGER,
+        port_speed INTEGER
+    ) WITHOUT ROWID;
+
+    CREATE TABLE summary_city (
+        country_code TEXT,
+        city_code TEXT,
+        city_name TEXT,
+        relays INTEGER,
+        active INTEGER,
+        owned INTEGER,
+        daita INTEGER,
+        port_speed INTEGER,
+        PRIMARY KEY (country_code, city_code)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE summary_provider (
+        provider TEXT PRIMARY KEY,
+        relays INTEGER,
+        active INTEGER,
+        owned INTEGER,
+        daita INTEGER,
+        port_speed INTEGER
+    ) WITHOUT ROWID;
+    ''')
+    refresh_summaries(cur)
+
+
+def _create_session_stats(cur):
+    """
+    v4: per-relay rolling session aggregates (`relay_stats`) and the open session for
+    each active interface (`active_sessions`), filled in by `mull up` / `mull down`.
+    """
+    _execute_script(cur, '''
+    CREATE TABLE relay_stats (
+        hostname TEXT PRIMARY KEY,
+        sessions INTEGER NOT NULL DEFAULT 0,
+        handshake_failures INTEGER NOT NULL DEFAULT 0,
+        total_seconds REAL NOT NULL DEFAULT 0,
+        total_rx INTEGER NOT NULL DEFAULT 0,
+        total_tx INTEGER NOT NULL DEFAULT 0,
+        avg_first_handshake REAL,
+        last_used INTEGER
+    ) WITHOUT ROWID;
+
+    CREATE TABLE active_sessions (
+        interface TEXT PRIMARY KEY,
+        started_at REAL NOT NULL,
+        first_handshake REAL
+    ) WITHOUT ROWID;
+    ''')
+
+
+def _create_endpoint_cache(cur):
+    """v5: winning address family per relay from the last `mull up --family auto` race."""
+    cur.execute('''
+    CREATE TABLE endpoint_cache (
+        hostname TEXT PRIMARY KEY,
+        family INTEGER NOT NULL CHECK(family IN (4, 6)),
+        rtt_ms REAL,
+        checked_at INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''')
+
+
+def _create_meta(cur):
+    """
+    v6: key/value metadata. `generation` is bumped by init_db.py on every refresh and
+    keys the `query` result cache. It starts at the current unix time, so a database
+    that was deleted and rebuilt never reuses an earlier generation.
+    """
+    _execute_script(cur, '''
+    CREATE TABLE meta (
+        key TEXT PRIMARY KEY,
+        value
+    ) WITHOUT ROWID;
+
+    INSERT INTO meta (key, value) VALUES ('generation', CAST(strftime('%s', 'now') AS INTEGER));
+    ''')
+
+
+def _index_relay_providers(cur):
+    """v7: index `relay_data.provider_id`, so `query --provider` resolves the provider first instead of scanning."""
+    cur.execute("CREATE INDEX relay_data_provider ON relay_data(provider_id)")
+
+
+MIGRATIONS = [
+    _create_relays_table,
+    _normalize_relays,
+    _create_summary_tables,
+    _create_session_stats,
+    _create_endpoint_cache,
+    _create_meta,
+    _index_relay_providers,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+## ------------- MATERIALIZED SUMMARIES ------------- ##
+
+_SUMMARY_COUNTS = """
+    COUNT(*), SUM(active), SUM(owned), SUM(daita), SUM(network_port_speed)
+"""
+
+def refresh_summaries(cur):
+    """Rebuilds the summary_* aggregate tables from the current relays."""
+    _execute_script(cur, f'''
+    DELETE FROM summary_country;
+    INSERT INTO summary_country
+    SELECT country_code, MAX(country_name), {_SUMMARY_COUNTS}
+    FROM relays GROUP BY country_code;
+
+    DELETE FROM summary_city;
+    INSERT INTO summary_city
+    SELECT country_code, city_code, MAX(city_name), {_SUMMARY_COUNTS}
+    FROM relays GROUP BY country_code, city_code;
+
+    DELETE FROM summary_provider;
+    INSERT INTO summary_provider
+    SELECT provider, {_SUMMARY_COUNTS}
+    FROM relays WHERE provider IS NOT NULL GROUP BY provider;
+    ''')
+
+
+## ------------- RUNNER ------------- ##
+
+def migrate(conn):
+    """
+    Applies pending migrations in order. Safe to call on every connection, including
+    from several processes opening the same un-migrated database at once: each step
+    takes the write lock (`BEGIN IMMEDIATE`) and re-reads the version under it, so a
+    migration another process already applied is skipped.
+    """
+    version = _schema_version(conn)
+    while version < SCHEMA_VERSION:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")  # outside the try: if it fails there is nothing to roll back
+        try:
+            version = _schema_version(cur)
+            if version < SCHEMA_VERSION:
+                MIGRATIONS[version](cur)
+                version += 1
+                cur.execute(f"PRAGMA user_version = {version}")
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        finally:
+            cur.close()
+
+
+def _schema_version(conn):
+    """Reads `PRAGMA user_version`, refusing databases written by a newer mull."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema v{version} is newer than this version of mull (v{SCHEMA_VERSION})"
+        )
+    return version
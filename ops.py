@@ -1,7 +1,14 @@
 import configparser
 import subprocess
+import functools
+import argparse
 import requests
 import sqlite3
+import socket
+import shlex
+import json
+import time
+import csv
 import sys
 import re
 import os
@@ -9,14 +16,26 @@ import os
 ## ------------- LOAD DEFAULTS FROM CONF FILE ------------- ##
 
 from config import (
-    CONFIG, BASE_DIR, CONFIG_PATH,
+    CONFIG,
     DATABASE_PATH, DEFAULT_RELAYS,
     INIT_DB_PATH, TORRENT_CLIENTS,
-    QUERY_RESULTS_FILE_PATH
+    QUERY_RESULTS_FILE_PATH, WATCHDOG_LOG_PATH,
+    SNAPSHOT_PATH, QUERY_CACHE_DIR,
+    defaults_lock, conf_changed, reload_config,
+    write_config, read_default_relays
     )
+from migrations import migrate
+from snapshot import open_snapshot, snapshot_generation
+from query_cache import QueryCache
+import wg_native
+import endpoints
 
 
-LEN_DEFAULTS = len(DEFAULT_RELAYS)
+## ------------- BATCH STATE ------------- ##
+
+_SHARED_CONN = None  # set by `run_batch` so every command reuses one connection
+_DEFER_CONF  = False # when set, `_write_relays_to_conf` only marks the list as dirty
+_CONF_DIRTY  = False
 
 ## ------------- UTILITY FUNCTIONS ------------- ##
 
@@ -31,10 +50,32 @@ def _validate_relay(relay):
     return re.match(single, relay) or re.match(multi, relay)
 
 def _write_relays_to_conf(DEFAULT_RELAYS):
-    """Writes default relays to .conf file."""
-    CONFIG['RELAYS'] = {i:relay for i, relay in enumerate(DEFAULT_RELAYS)}
-    with open(CONFIG_PATH, 'w') as configfile:
-        CONFIG.write(configfile)   
+    """Writes default relays to .conf file atomically under the defaults lock (deferred while in a batch)."""
+    global _CONF_DIRTY
+    if _DEFER_CONF:
+        _CONF_DIRTY = True
+        return
+
+    with defaults_lock():
+        if conf_changed():
+            print("[ERROR] `defaults.conf` was modified by another process, changes not saved")
+            sys.exit(1)
+        CONFIG['RELAYS'] = {i:relay for i, relay in enumerate(DEFAULT_RELAYS)}
+        write_config(CONFIG)
+
+def _locked_defaults(func):
+    """
+    Runs a defaults mutation under the defaults lock, first reloading
+    DEFAULT_RELAYS in place if another process changed defaults.conf.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with defaults_lock():
+            if conf_changed():
+                reload_config()
+                DEFAULT_RELAYS[:] = read_default_relays()
+            return func(*args, **kwargs)
+    return wrapper
 
 def _is_integer(string):
     """Check if string is an (+-) integer."""
@@ -43,10 +84,10 @@ def _is_integer(string):
 def _fetch_relay_from_defaults(relay): #digit
     """Fetch relay from default (favorites) list using idx.""" 
     idx = int(relay)
-    if idx < LEN_DEFAULTS:
+    if idx < len(DEFAULT_RELAYS):
         return DEFAULT_RELAYS[idx] 
     else:
-        print(f"[ERROR] `{idx}` is larger than items in list `{LEN_DEFAULTS}`")
+        print(f"[ERROR] `{idx}` is larger than items in list `{len(DEFAULT_RELAYS)}`")
         sys.exit()
 
 def _green_str(string):
@@ -83,6 +124,7 @@ def _resolve_relay_argument(args):
 ## ------------- VIEWING & MODIFYING DEFAULT RELAYS ------------- ##
 
 
+@_locked_defaults
 def add_default_relay(args):
     """Adds relay to default relay list and saves list to .conf file."""
     relay = _resolve_relay_argument(args)
@@ -101,6 +143,7 @@ def add_default_relay(args):
         print(f"[ERROR] Cannot append to default list, `{relay}` is not in the right format (ab-cde-fg-123)")
 
 
+@_locked_defaults
 def remove_default_relay(args):
     """Removes relay from default relay list and saves list to .conf file."""
     relay = args.relay
@@ -120,6 +163,7 @@ def remove_default_relay(args):
     else:
         print(f"Relay `{relay}` not found.")
 
+@_locked_defaults
 def swap_default_relays(args):
     """Swaps index position of two relays in the default relay list and saves list to .conf file."""
 
@@ -131,6 +175,7 @@ def swap_default_relays(args):
     except IndexError:
         print("Invalid indices. Ensure they are within range.")  
 
+@_locked_defaults
 def move_default_relay(args):
     """Move relay to another index position in the default relay list."""
     try:
@@ -251,33 +296,73 @@ def _is_torrenting():
     return False
 
 
-def _handle_relay(args, relay):
-    """Handles activation/deactivation of relay."""
-    msg = {'up' : 'Activated', 'down' : 'Deactivated'}
+def _run_wg_quick(args, relay):
+    """Runs `wg-quick up|down <relay>`, returns its output."""
+    result = subprocess.run(
+        ['sudo', 'wg-quick', args.action, relay],
+        stdout=subprocess.PIPE,   # Capture stdout
+        stderr=subprocess.STDOUT, # Combine stderr with stdout
+        text=True,                # Get output as text (string)
+        check=True                # Raise CalledProcessError if command fails
+    )
+    return result.stdout
+
+
+def _set_peer_endpoint(relay, host):
+    """Points the peers of the running `relay` interface at `host`, keeping their ports. Returns the command output."""
+    output = _get_wg_dump(relay)
+    argv   = ['sudo', 'wg', 'set', relay]
+    for peer in _parse_wg_dump(output) if output else []:
+        if peer["endpoint"] != "(none)":
+            argv += ['peer', peer["public_key"], 'endpoint', wg_native.with_endpoint_host(peer["endpoint"], host)]
+    result = subprocess.run(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, check=True)
+    return f"[#] {' '.join(argv[1:])}\n{result.stdout}"
+
+
+def _run_native(args, relay, endpoint=None):
+    """Applies `relay`'s config directly with ip/wg (see wg_native.py), falls back to wg-quick for unsupported configs."""
+    try:
+        return wg_native.up(relay, endpoint) if args.action == 'up' else wg_native.down(relay)
+    except wg_native.UnsupportedConfig as e:
+        print(f"[NATIVE] {e}, falling back to wg-quick")
+        output = _run_wg_quick(args, relay)
+        if endpoint:
+            output += _set_peer_endpoint(relay, endpoint)
+        return output
+
+
+def _handle_relay(args, relay, endpoint=None):
+    """
+    Handles activation/deactivation of relay, returns True on success.
+    `endpoint` overrides the host of the config's peer endpoint when bringing the relay up.
+    """
+    msg    = {'up' : 'Activated', 'down' : 'Deactivated'}
+    engine = getattr(args, 'engine', 'wg-quick')
 
     if _validate_relay(relay): 
         try:
-            result = subprocess.run(
-                ['sudo', 'wg-quick', args.action, relay],
-                stdout=subprocess.PIPE,   # Capture stdout
-                stderr=subprocess.STDOUT, # Combine stderr with stdout
-                text=True,                # Get output as text (string)
-                check=True                # Raise CalledProcessError if command fails
-            )
+            if engine == 'native':
+                output = _run_native(args, relay, endpoint)
+            else:
+                output = _run_wg_quick(args, relay)
+                if endpoint:
+                    output += _set_peer_endpoint(relay, endpoint)
 
             print(_green_str(f"{msg[args.action]}: {relay}"))                
             
             if args.verbose: 
-                print(result.stdout)  # prints `wg-quick` output
+                print(output)  # prints `wg-quick` / native engine output
+            return True
 
         except subprocess.CalledProcessError as e:
-            print(f"[ERROR] wg-quick failed with code {e.returncode}")
+            print(f"[ERROR] {engine} failed with code {e.returncode}")
             print(f"Output: {e.output or e.stdout}")
             print(f"Error:  {e.stderr or 'No error output available'}")
         except Exception as e:
             print(f"Unexpected error: {e}")
     else:
         print(f"[FORMAT ERROR] `{relay}` is not in the right format (ab-cde-fg-123)")
+    return False
 
 
 def handle_up(args):
@@ -297,7 +382,7 @@ def handle_up(args):
             print("No relay specified and no defaults available. Provide a relay hostname.")
             sys.exit(1)
     
-    _handle_relay(args, relay)
+    _connect(args, relay)
     
 
 def handle_down(args):
@@ -317,21 +402,203 @@ def handle_down(args):
     interfaces = _get_active_relays()
     if interfaces:
         relay = interfaces[0]
-        _handle_relay(args, relay) # Deactivate
+        _disconnect(args, relay) # Deactivate
     else:
         print("No active relays detected")
         sys.exit()         
 
 
+## ------------- SESSION STATS ------------- ##
+
+SESSION_HANDSHAKE_TIMEOUT = 3    # seconds `up` waits to time the first handshake
+HANDSHAKE_EMA_WEIGHT      = 0.2  # weight of the newest session in avg_first_handshake
+
+# Laplace-smoothed share of sessions that completed a handshake (0.5 for unused relays)
+RELIABILITY_SQL = """
+    (COALESCE(relay_stats.sessions, 0) - COALESCE(relay_stats.handshake_failures, 0) + 1.0)
+    / (COALESCE(relay_stats.sessions, 0) + 2)
+"""
+
+def _commit(conn):
+    """Commits unless conn is the shared batch connection (committed when the batch ends)."""
+    if conn is not _SHARED_CONN:
+        conn.commit()
+
+def _start_session(relay, timeout=SESSION_HANDSHAKE_TIMEOUT):
+    """Opens a session record for `relay` and times its first handshake. Returns the seconds taken or None."""
+    started_at      = time.time()
+    first_handshake = _wait_for_handshake(relay, timeout)
+    if first_handshake is None:
+        print(_orange_str(f"[WARNING] No handshake from `{relay}` within {timeout}s"))
+
+    conn = _get_connection()
+    conn.execute(
+        "INSERT OR REPLACE INTO active_sessions (interface, started_at, first_handshake) VALUES (?, ?, ?);",
+        (relay, started_at, first_handshake)
+    )
+    _commit(conn)
+    _close_connection(conn)
+    return first_handshake
+
+def _end_session(relay, peers, failed=False):
+    """
+    Folds the session for `relay` into its rolling relay_stats row.
+    `peers` is the parsed `wg show` dump taken just before teardown.
+    """
+    conn = _get_connection()
+    cur  = conn.cursor()
+    cur.execute("SELECT started_at, first_handshake FROM active_sessions WHERE interface = ?;", (relay,))
+    session = cur.fetchone()
+    if session is None:  # brought up outside mull, there is no session to count
+        cur.close()
+        _close_connection(conn)
+        return
+    cur.execute("DELETE FROM active_sessions WHERE interface = ?;", (relay,))
+
+    now             = time.time()
+    started_at      = session["started_at"]
+    first_handshake = session["first_handshake"]
+    rx = sum(peer["rx"] for peer in peers)
+    tx = sum(peer["tx"] for peer in peers)
+    handshaked = first_handshake is not None or any(peer["latest_handshake"] for peer in peers)
+
+    cur.execute("""
+        INSERT INTO relay_stats (
+            hostname, sessions, handshake_failures, total_seconds,
+            total_rx, total_tx, avg_first_handshake, last_used
+        ) VALUES (:hostname, 1, :failed, :seconds, :rx, :tx, :first_handshake, :now)
+        ON CONFLICT(hostname) DO UPDATE SET
+            sessions            = sessions + 1,
+            handshake_failures  = handshake_failures + excluded.handshake_failures,
+            total_seconds       = total_seconds + excluded.total_seconds,
+            total_rx            = total_rx + excluded.total_rx,
+            total_tx            = total_tx + excluded.total_tx,
+            avg_first_handshake = CASE
+                WHEN excluded.avg_first_handshake IS NULL THEN avg_first_handshake
+                WHEN avg_first_handshake IS NULL THEN excluded.avg_first_handshake
+                ELSE (1 - :weight) * avg_first_handshake + :weight * excluded.avg_first_handshake
+            END,
+            last_used           = excluded.last_used;
+    """, {
+        "hostname": relay, "failed": int(failed or not handshaked), "seconds": now - started_at,
+        "rx": rx, "tx": tx, "first_handshake": first_handshake, "now": int(now),
+        "weight": HANDSHAKE_EMA_WEIGHT,
+    })
+    _commit(conn)
+    cur.close()
+    _close_connection(conn)
+
+def _connect(args, relay):
+    """Brings `relay` up and opens its session record. Returns True on success."""
+    family   = getattr(args, 'family', None)
+    endpoint = _select_endpoint(relay, family) if family else None
+    if not _handle_relay(args, relay, endpoint):
+        return False
+    _start_session(relay)
+    return True
+
+def _disconnect(args, relay, failed=False):
+    """Records the session summary for `relay` and brings it down. Returns True on success."""
+    output = _get_wg_dump(relay)
+    peers  = _parse_wg_dump(output) if output else []
+    if not _handle_relay(args, relay):
+        return False
+    _end_session(relay, peers, failed)
+    return True
+
+def _print_relay_stats(cur, relay):
+    """Prints observed session stats for `relay`, if it has been used."""
+    cur.execute(f"""
+        SELECT sessions, handshake_failures, {RELIABILITY_SQL} AS reliability,
+               avg_first_handshake, total_seconds / 3600.0 AS hours_used, total_rx, total_tx
+        FROM relay_stats WHERE hostname = ?;
+    """, (relay,))
+    stats = cur.fetchone()
+    if not stats:
+        return
+    stats = dict(stats)
+    stats["reliability"]         = f"{stats['reliability']:.2f}"
+    stats["avg_first_handshake"] = f"{stats['avg_first_handshake']:.2f}s" if stats["avg_first_handshake"] is not None else None
+    stats["hours_used"]          = f"{stats['hours_used']:.1f}"
+    columns = {
+        "sessions": 9, "handshake_failures": 19, "reliability": 12,
+        "avg_first_handshake": 20, "hours_used": 11, "total_rx": 14, "total_tx": 1,
+        }
+    _print_query_col_header(columns)
+    _print_query_row_values(stats, columns)
+    print()
+
+
+## ------------- ENDPOINT FAMILY ------------- ##
+
+ENDPOINT_CACHE_TTL = 3600  # seconds a race winner is reused before racing the relay again
+
+def _select_endpoint(relay, family):
+    """
+    Returns the address `relay` should be reached on, or None to keep the config's endpoint.
+    `family` is '4' or '6' to force one, or 'auto' to race both (see endpoints.py) and reuse
+    the cached winner while it is younger than ENDPOINT_CACHE_TTL.
+    """
+    conn = _get_connection()
+    cur  = conn.cursor()
+    cur.execute("SELECT ipv4_addr_in, ipv6_addr_in FROM relays WHERE hostname = ?;", (relay,))
+    row = cur.fetchone()
+    addresses = {4: row["ipv4_addr_in"], 6: row["ipv6_addr_in"]} if row else {}
+    addresses = {version: address for version, address in addresses.items() if address}
+
+    address = None
+    if family != 'auto':
+        address = addresses.get(int(family))
+        if not address:
+            print(_orange_str(f"[WARNING] No IPv{family} address for `{relay}`, keeping the config's endpoint"))
+    elif addresses:
+        now = int(time.time())
+        cur.execute(
+            "SELECT family, rtt_ms FROM endpoint_cache WHERE hostname = ? AND checked_at > ?;",
+            (relay, now - ENDPOINT_CACHE_TTL)
+        )
+        cached = cur.fetchone()
+        if cached and cached["family"] in addresses:
+            version, rtt_ms, source = cached["family"], cached["rtt_ms"], "cached"
+        else:
+            winner = endpoints.race(addresses)
+            if winner is None:
+                print(_orange_str(f"[WARNING] Neither address of `{relay}` answered, keeping the config's endpoint"))
+                version = None
+            else:
+                version, rtt_ms, source = winner[0], winner[1] * 1000, "raced"
+                cur.execute(
+                    "INSERT OR REPLACE INTO endpoint_cache (hostname, family, rtt_ms, checked_at) VALUES (?, ?, ?, ?);",
+                    (relay, version, rtt_ms, now)
+                )
+                _commit(conn)
+        if version:
+            address = addresses[version]
+            print(f"Using IPv{version} endpoint {address} ({rtt_ms:.1f} ms, {source})")
+
+    cur.close()
+    _close_connection(conn)
+    return address
+
+
 ## ------------- DATABASE FETCHING AND QUERYING ------------- ##
    
 def _get_connection():
     """Connects to local database where Mullvad server info is stored."""
+    if _SHARED_CONN is not None:
+        return _SHARED_CONN
     conn = sqlite3.connect(DATABASE_PATH) # 'relays.db'
     conn.row_factory = sqlite3.Row # if doing this for all queries (reutrns a column : value)
+    migrate(conn)                  # bring older databases up to the current schema in place
     return conn
 
 
+def _close_connection(conn):
+    """Closes connection unless it is the shared batch connection."""
+    if conn is not _SHARED_CONN:
+        conn.close()
+
+
 def _print_query_col_header(default_columns: dict):
     """Prints the query column names."""
     print(
@@ -400,6 +667,10 @@ def print_query_results(args=None):
 
 def update_database(args=None):
     """Fetches the current Mullvad server information and updates local database."""
+    # Release the batch read transaction so init_db.py can write
+    if _SHARED_CONN is not None:
+        _SHARED_CONN.commit()
+
     try:
         result = subprocess.run(['python', INIT_DB_PATH], capture_output=True, text=True)
 
@@ -456,6 +727,9 @@ def fetch_relay_info(args):
     _print_query_row_values(default_results, default_columns)
     print()
 
+    # Print observed session stats
+    _print_relay_stats(cur, relay)
+
     # Print additional info
     if args.verbose:
 
@@ -482,7 +756,105 @@ def fetch_relay_info(args):
         print()
         
     cur.close()
-    conn.close()
+    _close_connection(conn)
+
+
+# Columns `query` can filter on (after --country / --city are resolved to code or name)
+QUERY_FILTER_COLUMNS = (
+    "country_code", "country_name", "city_code", "city_name",
+    "provider", "active", "owned", "daita",
+)
+
+# Columns `query` returns for each matching relay
+QUERY_RESULT_COLUMNS = (
+    "hostname", "country_name", "city_name",
+    "active", "owned", "daita", "status_messages",
+)
+
+def _select_relays(query_params, sort=None):
+    """
+    Returns QUERY_RESULT_COLUMNS dicts for relays matching all `query_params`, ordered by hostname.
+
+    Unsorted queries are answered from the memory-mapped snapshot written by init_db.py
+    when one exists, without opening SQLite; both paths return identical rows.
+    """
+    if sort is None:
+        snap = open_snapshot(SNAPSHOT_PATH)
+        if snap is not None:
+            return snap.query(query_params, QUERY_RESULT_COLUMNS)
+
+    columns = ", ".join(f"relays.{col}" for col in QUERY_RESULT_COLUMNS)
+
+    # Build the base of the query
+    query = f"SELECT {columns} FROM relays WHERE "
+    if sort == 'reliability':
+        query = f"SELECT {columns}, {RELIABILITY_SQL} AS reliability FROM relays LEFT JOIN relay_stats USING (hostname) WHERE "
+    
+    # Create a list of conditions and values based on the dictionary keys
+    conditions = []
+    values     = []
+
+    for key, value in query_params.items():
+        if key in ['country_name', 'city_name']:
+            conditions.append(f"{key} COLLATE NOCASE LIKE ?")
+            values.append(f"%{value}%")
+        else:
+            conditions.append(f"{key} COLLATE NOCASE = ?")
+            values.append(value)
+
+    # Join all conditions with 'AND'
+    query += " AND ".join(conditions)
+
+    # Most reliable first, faster first handshake breaks ties
+    if sort == 'reliability':
+        query += " ORDER BY reliability DESC, COALESCE(relay_stats.avg_first_handshake, 1e9), hostname"
+    else:
+        query += " ORDER BY hostname"
+    
+    # Conect to DB   
+    conn = _get_connection()
+    cur  = conn.cursor()
+    
+    # Execute the query with the values from the dictionary
+    cur.execute(query, tuple(values))
+    results = [dict(row) for row in cur.fetchall()]
+
+    # Close the connection
+    cur.close()
+    _close_connection(conn)
+    return results
+
+
+def _db_generation():
+    """Current database generation, read from the snapshot header when possible so cache hits skip SQLite."""
+    generation = snapshot_generation(SNAPSHOT_PATH)
+    if generation is None:
+        conn = _get_connection()
+        generation = conn.execute("SELECT value FROM meta WHERE key = 'generation';").fetchone()[0]
+        _close_connection(conn)
+    return generation
+
+
+def _cached_select_relays(query_params, trace=False):
+    """
+    `_select_relays` behind the on-disk LRU result cache (see query_cache.py), keyed on the
+    normalized filters and the database generation. Reliability-sorted queries are not cached,
+    their order changes with every session rather than with database refreshes.
+    """
+    cache   = QueryCache(QUERY_CACHE_DIR, _db_generation())
+    results = cache.get(query_params)
+    outcome = "hit" if results is not None else "miss"
+    if results is None:
+        results = _select_relays(query_params)
+        cache.put(query_params, results)
+    cache.save()
+
+    if trace:
+        print(
+            f"[TRACE] query cache {outcome}: generation {cache.generation}, {len(cache.keys)}/{cache.size} entries",
+            file=sys.stderr
+        )
+    return results
 
 
 def query_database(args):
@@ -510,10 +882,10 @@ def query_database(args):
         city_key = "city_code" if len(args.city) == 3 else "city_name"
         namespace_dict[city_key] = namespace_dict.pop('city')
     
-    # Filter available while removing ['func']
+    # Keep only the filters that were provided
     query_params = {
         k:v for k,v in namespace_dict.items()
-        if v is not None and k != 'func'
+        if v is not None and k in QUERY_FILTER_COLUMNS
     }
     
     # Catch empty query
@@ -521,33 +893,10 @@ def query_database(args):
         print("No query provided. Exiting...")
         sys.exit()
 
-    # Build the base of the query
-    query = "SELECT * FROM relays WHERE "
-    
-    # Create a list of conditions and values based on the dictionary keys
-    conditions = []
-    values     = []
-
-    for key, value in query_params.items():
-        if key in ['country_name', 'city_name']:
-            conditions.append(f"{key} COLLATE NOCASE LIKE ?")
-            values.append(f"%{value}%")
-        else:
-            conditions.append(f"{key} COLLATE NOCASE = ?")
-            values.append(value)
-
-    # Join all conditions with 'AND'
-    query += " AND ".join(conditions)
-    
-    # Conect to DB   
-    conn = _get_connection()
-    cur  = conn.cursor()
-    
-    # Execute the query with the values from the dictionary
-    cur.execute(query, tuple(values))
-    
-    # Fetch the results
-    results = cur.fetchall()
+    if args.sort is None:
+        results = _cached_select_relays(query_params, trace=getattr(args, 'trace', False))
+    else:
+        results = _select_relays(query_params, sort=args.sort)
     
     if not results:
         print("No results found matching specified query")
@@ -558,20 +907,325 @@ def query_database(args):
         "IDX": 4, "hostname": 13, "country_name" : 15, "city_name": 20, 
         "active" : 8, "owned" : 6, "daita" : 6, "status_messages" : 1,
         }
+    if args.sort == 'reliability':
+        default_columns = {"IDX": 4, "hostname": 13, "reliability": 12} | default_columns
+        results = [row | {"reliability": f"{row['reliability']:.2f}"} for row in results]
 
     # Print column headers
     _print_query_col_header(default_columns) 
 
     # Print the results for the default columns
     for idx, row in enumerate(results):
-        # Creates `col`:`value` pairs from each Sqlite3.Row object only for desired display columns
-        row_data  = {"IDX" : idx} | {col: row[col] for col in default_columns if col in dict(row)}
+        # Creates `col`:`value` pairs from each result row only for desired display columns
+        row_data  = {"IDX" : idx} | {col: row[col] for col in default_columns if col in row}
         # Get column values and combine into a single string
         _print_query_row_values(row_data, default_columns)
 
     # Write hostname results to file
     _write_query_results(query_results=results)
 
-    # Close the connection
+
+## ------------- SUMMARY ------------- ##
+
+# Aggregate table and output columns (with widths) for each `summary --by` grouping
+SUMMARY_VIEWS = {
+    "country" : ("summary_country",  {"country_code": 13, "country_name": 20}),
+    "city"    : ("summary_city",     {"country_code": 13, "city_code": 10, "city_name": 20}),
+    "provider": ("summary_provider", {"provider": 20}),
+}
+SUMMARY_COUNT_COLUMNS = {"relays": 7, "active": 7, "owned": 6, "daita": 6, "port_speed": 10}
+
+
+def print_summary(args):
+    """Prints relay counts and total port speed per country, city or provider from the precomputed summary tables."""
+    table, key_columns = SUMMARY_VIEWS[args.by]
+    columns = key_columns | SUMMARY_COUNT_COLUMNS
+
+    conn = _get_connection()
+    cur  = conn.cursor()
+    cur.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {', '.join(key_columns)}")
+    results = [dict(row) for row in cur.fetchall()]
+    cur.close()
+    _close_connection(conn)
+
+    if not results:
+        print("No summary available, run `mull update` first")
+        sys.exit()
+
+    if args.format == 'json':
+        print(json.dumps(results, indent=2))
+    elif args.format == 'csv':
+        writer = csv.DictWriter(sys.stdout, fieldnames=list(columns))
+        writer.writeheader()
+        writer.writerows(results)
+    else:
+        _print_query_col_header(columns)
+        for row in results:
+            _print_query_row_values(row, columns)
+
+
+## ------------- WATCHDOG ------------- ##
+
+MULLVAD_TUNNEL_DNS = ("10.64.0.1", 53)  # resolver only reachable through the tunnel
+
+def _get_wg_dump(interface):
+    """Returns `wg show <interface> dump` output, None if the interface is gone."""
+    result = subprocess.run(
+        ['sudo', 'wg', 'show', interface, 'dump'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True
+    )
+    return result.stdout if result.returncode == 0 else None
+
+def _parse_wg_dump(output):
+    """
+    Parses `wg show <interface> dump` into a list of peer dicts.
+    The first line describes the interface, each following line is a tab separated peer:
+    public-key, preshared-key, endpoint, allowed-ips, latest-handshake, transfer-rx, transfer-tx, keepalive
+    """
+    peers = []
+    for line in output.strip().splitlines()[1:]:
+        fields = line.split('\t')
+        if len(fields) < 8:
+            continue
+        peers.append({
+            "public_key"       : fields[0],
+            "endpoint"         : fields[2],
+            "latest_handshake" : int(fields[4]),  # unix seconds, 0 = never
+            "rx"               : int(fields[5]),
+            "tx"               : int(fields[6]),
+        })
+    return peers
+
+def _nudge_tunnel():
+    """Sends one DNS query through the tunnel so a healthy peer keeps handshaking and receiving."""
+    # id 0x6d75, recursion desired, 1 question: am.i.mullvad.net A IN
+    query = (
+        b"\x6d\x75\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00"
+        b"\x02am\x01i\x07mullvad\x03net\x00\x00\x01\x00\x01"
+    )
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(query, MULLVAD_TUNNEL_DNS)
+    except OSError:
+        pass
+
+def _wait_for_handshake(relay, timeout, poll=0.1):
+    """
+    Waits up to `timeout` seconds for a handshake on `relay`, returns seconds taken or None.
+    The tunnel is nudged once, only if it has not handshaked yet: WireGuard retries the
+    handshake for the queued packet itself and rate-limits initiations, so more nudges add nothing.
+    """
+    start, nudged = time.monotonic(), False
+    while True:
+        output = _get_wg_dump(relay)
+        peers  = _parse_wg_dump(output) if output else []
+        if any(peer["latest_handshake"] for peer in peers):
+            return time.monotonic() - start
+        elapsed = time.monotonic() - start
+        if elapsed >= timeout:
+            return None
+        if not nudged:
+            _nudge_tunnel()
+            nudged = True
+        time.sleep(min(poll, timeout - elapsed))
+
+def _watchdog_candidates(source, current):
+    """Relays to fail over to, in list order starting after `current`, skipping relays inactive in the database."""
+    relays = _load_query_results() if source == 'results' else list(DEFAULT_RELAYS)
+    if current in relays:
+        idx    = relays.index(current)
+        relays = relays[idx + 1:] + relays[:idx]
+
+    conn = _get_connection()
+    cur  = conn.cursor()
+    candidates = []
+    for relay in relays:
+        cur.execute("SELECT active FROM relays WHERE hostname = ?;", (relay,))
+        row = cur.fetchone()
+        if row is None or row["active"]:
+            candidates.append(relay)
     cur.close()
-    conn.close()
\ No newline at end of file
+    _close_connection(conn)
+    return candidates
+
+def _tunnel_fault(peer, watching_since, rx_changed_at, stale, stall, now, wall_now):
+    """
+    Returns why the tunnel looks dead (stale handshake or nothing received), None if it is healthy.
+    `now` / `watching_since` / `rx_changed_at` are monotonic, `wall_now` is unix time like the dump's handshake.
+    """
+    if peer["latest_handshake"]:
+        handshake_age = wall_now - peer["latest_handshake"]
+    else:
+        handshake_age = now - watching_since   # no handshake yet, count from when watching started
+
+    if handshake_age > stale:
+        return f"handshake stale ({handshake_age:.0f}s)"
+    if now - rx_changed_at > stall:
+        return f"no traffic received ({now - rx_changed_at:.0f}s)"
+    return None
+
+def _log_recovery(old_relay, new_relay, reason, seconds):
+    """Appends one failover record to the watchdog log."""
+    stamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+    with open(WATCHDOG_LOG_PATH, 'a') as f:
+        f.write(f"{stamp}\t{old_relay}\t{new_relay or 'FAILED'}\t{reason}\t{seconds:.2f}s\n")
+
+def _failover(args, relay, reason):
+    """
+    Tears down `relay` and brings up the first candidate that completes a handshake. Returns the new relay or None.
+    When there is nothing to fail over to, `relay` is left up.
+    """
+    detected  = time.monotonic()
+    up_args   = argparse.Namespace(action='up', verbose=False, engine=args.engine)
+    down_args = argparse.Namespace(action='down', verbose=False, engine=args.engine)
+
+    try:
+        candidates = _watchdog_candidates(args.source, relay)
+    except TypeError as e:  # query results removed while watching
+        print(f"[WATCHDOG] {e}")
+        candidates = []
+    if not candidates:
+        _log_recovery(relay, None, reason, time.monotonic() - detected)
+        print(f"[WATCHDOG] No relay to fail over to, leaving `{relay}` up")
+        return None
+
+    if not _disconnect(down_args, relay, failed=True):
+        _log_recovery(relay, None, reason, time.monotonic() - detected)
+        print(f"[WATCHDOG] Could not bring `{relay}` down, not failing over")
+        return None
+    for candidate in candidates:
+        if not _handle_relay(up_args, candidate):
+            continue
+        if _start_session(candidate, args.handshake_timeout) is not None:
+            recovery = time.monotonic() - detected
+            _log_recovery(relay, candidate, reason, recovery)
+            print(_green_str(f"Recovered on `{candidate}` in {recovery:.2f}s"))
+            return candidate
+        print(f"[WATCHDOG] No handshake from `{candidate}`, trying next relay")
+        if not _disconnect(down_args, candidate, failed=True):  # bringing up the next one would stack tunnels
+            _log_recovery(relay, None, reason, time.monotonic() - detected)
+            print(f"[WATCHDOG] Could not bring `{candidate}` down, not trying further relays")
+            return None
+
+    _log_recovery(relay, None, reason, time.monotonic() - detected)
+    print("[WATCHDOG] No healthy relay available")
+    return None
+
+def run_watchdog(args):
+    """
+    Monitors the active relay's handshake age and transfer counters, failing over to the
+    next healthy relay (defaults or query results) when the handshake goes stale or the
+    tunnel stops receiving. Each failover is logged to `watchdog.log` with its recovery time.
+    """
+    # Fail on a missing / empty results file now, not after the tunnel has been torn down
+    if args.source == 'results':
+        try:
+            _load_query_results()
+        except TypeError as e:
+            print(f"[ERROR] {e}")
+            sys.exit(1)
+
+    interfaces = _get_active_relays()
+    if not interfaces:
+        print("No active relays detected")
+        sys.exit()
+    relay = interfaces[0]
+
+    print(f"Watching `{relay}` (Ctrl+C to stop)...")
+    started, last_rx, last_rx_change = time.monotonic(), None, time.monotonic()
+    try:
+        while True:
+            _nudge_tunnel()
+            time.sleep(args.interval)
+
+            output = _get_wg_dump(relay)
+            if output is None:
+                print(f"Interface `{relay}` is gone, stopping watchdog")
+                return
+            peers = _parse_wg_dump(output)
+            if not peers:
+                continue
+            peer, now = peers[0], time.monotonic()
+
+            if peer["rx"] != last_rx:
+                last_rx, last_rx_change = peer["rx"], now
+
+            reason = _tunnel_fault(peer, started, last_rx_change, args.stale, args.stall, now, time.time())
+            if reason is None:
+                continue
+
+            print(_orange_str(f"[WATCHDOG] `{relay}`: {reason}"))
+            if not args.force and _is_torrenting():
+                print(_orange_str("[WATCHDOG] Torrenting detected, not reconnecting (use --force to override)"))
+                last_rx_change = now
+                continue
+
+            new_relay = _failover(args, relay, reason)
+            if new_relay is None:
+                sys.exit(1)
+            relay, started, last_rx, last_rx_change = new_relay, time.monotonic(), None, time.monotonic()
+
+    except KeyboardInterrupt:
+        print("\nWatchdog stopped")
+
+
+## ------------- BATCH MODE ------------- ##
+
+@_locked_defaults
+def run_batch(args):
+    """
+    Runs subcommands read from a file (or stdin), one per line, in a single process.
+
+    All commands share one database connection (and read transaction) and one in-memory
+    defaults list; defaults.conf stays locked for the whole batch and is written once at
+    the end. Errors are reported per line.
+    """
+    from cli import build_parser  # deferred import, cli imports ops
+    global _SHARED_CONN, _DEFER_CONF, _CONF_DIRTY
+
+    with args.file as f:
+        lines = f.read().splitlines()
+
+    parser   = build_parser()
+    failures = 0
+    executed = 0
+
+    _SHARED_CONN = _get_connection()
+    _SHARED_CONN.execute("BEGIN")
+    _DEFER_CONF  = True
+
+    try:
+        for lineno, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            executed += 1
+            try:
+                cmd_args = parser.parse_args(shlex.split(line))
+                func     = getattr(cmd_args, 'func', None)
+                if func is None or func is run_batch:
+                    raise ValueError("not a runnable subcommand")
+                if func is run_watchdog:  # runs until interrupted, would hold the defaults lock forever
+                    raise ValueError("`watchdog` cannot run inside a batch")
+                func(cmd_args)
+            except SystemExit as e:
+                if e.code not in (0, None):  # bare `sys.exit()` exits 0 standalone too (e.g. no results)
+                    failures += 1
+                    print(f"[BATCH ERROR] line {lineno}: `{line}` exited")
+            except Exception as e:
+                failures += 1
+                print(f"[BATCH ERROR] line {lineno}: `{line}` failed: {e}")
+    finally:
+        _SHARED_CONN.commit()
+        _SHARED_CONN.close()
+        _SHARED_CONN = None
+        _DEFER_CONF  = False
+        if _CONF_DIRTY:
+            _CONF_DIRTY = False
+            _write_relays_to_conf(DEFAULT_RELAYS)
+
+    print(f"Batch finished: {executed} commands, {failures} failed")
+    if failures:
+        sys.exit(1)
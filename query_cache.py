@@ -0,0 +1,119 @@
+"""
+Bounded LRU cache of `query` results, kept in a directory next to the database.
+
+Entries are keyed on the normalized filter set and belong to one database
+generation (see the `meta` table, bumped by init_db.py on every refresh):
+
+    index.json                 {"generation": g, "keys": [...]}
+    <generation>-<digest>.json {"columns": [...], "rows": [[...], ...]}
+
+A hit reads the small index and the one entry it returns, never SQLite, and writes
+nothing: it only touches the entry's mtime, which is what eviction goes by. Every file
+is written to a temp file and renamed into place. A new generation replaces the
+whole index at once and entry names carry their generation, so results from an
+older database can never be served.
+"""
+import tempfile
+import hashlib
+import json
+import os
+
+from snapshot import _ASCII_LOWER
+
+CACHE_SIZE = 32   # entries kept per generation
+
+
+def cache_key(query_params):
+    """
+    Normalized key for a filter set: sorted by column, string values ASCII case-folded
+    (like SQLite's NOCASE / LIKE, so filters differing only in that fold share a key).
+    """
+    return json.dumps(sorted(
+        (column, value.translate(_ASCII_LOWER) if isinstance(value, str) else value)
+        for column, value in query_params.items()
+    ))
+
+
+class QueryCache:
+    """Result cache for one database generation. Call `save` after `put` to persist new entries and evictions."""
+
+    def __init__(self, directory, generation, size=CACHE_SIZE):
+        self.directory  = directory
+        self.generation = generation
+        self.size       = size
+        index = self._read(self._index_path) or {}
+        self.keys   = index.get("keys", []) if index.get("generation") == generation else []
+        self._prune = index.get("generation") != generation   # entry files to drop on `save`
+        self._dirty = self._prune                              # index to rewrite on `save`
+
+    @property
+    def _index_path(self):
+        return os.path.join(self.directory, "index.json")
+
+    def _entry_path(self, key):
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f"{self.generation}-{digest}.json")
+
+    def _last_used(self, key):
+        try:
+            return os.stat(self._entry_path(key)).st_mtime_ns
+        except OSError:
+            return 0
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path, data):
+        os.makedirs(self.directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=self.directory, prefix='.tmp.', delete=False) as tmp:
+            json.dump(data, tmp, separators=(',', ':'))
+        os.replace(tmp.name, path)
+
+    def get(self, query_params):
+        """Returns the cached result rows (dicts) for `query_params`, or None on a miss."""
+        key   = cache_key(query_params)
+        path  = self._entry_path(key)
+        entry = self._read(path) if key in self.keys else None
+        if entry is None:
+            if key in self.keys:
+                self.keys.remove(key)   # entry file lost, e.g. replaced by a concurrent run
+                self._dirty = True
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return [dict(zip(entry["columns"], row)) for row in entry["rows"]]
+
+    def put(self, query_params, rows):
+        """Stores result rows (dicts sharing the same keys) for `query_params`, evicting the least recently used entries."""
+        key     = cache_key(query_params)
+        columns = list(rows[0]) if rows else []
+        self._write(self._entry_path(key), {"columns": columns, "rows": [[row[col] for col in columns] for row in rows]})
+        if key not in self.keys:
+            self.keys.append(key)
+        if len(self.keys) > self.size:
+            self.keys.sort(key=self._last_used)
+            del self.keys[:-self.size]
+            self._prune = True
+        self._dirty = True
+
+    def save(self):
+        """Writes the index if it changed, then removes entry files it no longer lists (evicted or from older generations)."""
+        if not self._dirty:
+            return
+        self._write(self._index_path, {"generation": self.generation, "keys": self.keys})
+        self._dirty = False
+        if not self._prune:
+            return
+        keep = {os.path.basename(self._entry_path(key)) for key in self.keys} | {"index.json"}
+        for name in os.listdir(self.directory):
+            if name not in keep and not name.startswith('.tmp.'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
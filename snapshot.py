@@ -0,0 +1,245 @@
+"""
+Columnar, memory-mapped read snapshot of the relay catalog.
+
+init_db.py writes `relays.snap` after every refresh. `query` reads it instead of
+opening SQLite: filters become bitwise ANDs / ORs of precomputed bitmaps and only
+matching rows are decoded.
+
+File layout (little-endian):
+
+    b"MULLSNAP" | u32 version | u32 row count | u32 header length | u64 generation | JSON header | sections
+
+`generation` is the database generation (meta table) the snapshot was built from.
+
+The JSON header maps each column to its sections (byte offset + length):
+- `dict` columns (country, city, provider) store the distinct values in the header,
+  a u16 code per row and one bitmap per distinct value.
+- `flag` columns (active, owned, daita) store a u8 per row (255 = NULL) and bitmaps
+  for the rows equal to 1 and to 0.
+- `str` columns (hostname, status_messages) store u32 offsets into a UTF-8 blob.
+
+Rows are sorted by hostname; bit i of every bitmap refers to row i.
+"""
+import struct
+import json
+import mmap
+import os
+import re
+
+MAGIC   = b"MULLSNAP"
+VERSION = 2
+_PREFIX = struct.Struct("<8sIIIQ")
+
+DICT_COLUMNS = ("country_code", "country_name", "city_code", "city_name", "provider")
+FLAG_COLUMNS = ("active", "owned", "daita")
+STR_COLUMNS  = ("hostname", "status_messages")
+
+# Columns `query` matches with LIKE '%value%', everything else is compared with `=`
+LIKE_COLUMNS = ("country_name", "city_name")
+
+_NULL_FLAG = 255
+
+# SQLite's NOCASE and LIKE only fold ASCII letters
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+# Bit positions set in each byte value, for decoding result bitmaps
+_BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+## ------------- WRITING ------------- ##
+
+def _bitmap(rows, nbytes):
+    """Packs an iterable of row indices into a bitmap of `nbytes` bytes."""
+    bits = bytearray(nbytes)
+    for row in rows:
+        bits[row >> 3] |= 1 << (row & 7)
+    return bytes(bits)
+
+def write_snapshot(conn, path):
+    """Builds the snapshot from the `relays` view and atomically replaces `path`."""
+    columns    = STR_COLUMNS + DICT_COLUMNS + FLAG_COLUMNS
+    generation = conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+    rows       = conn.execute(f"SELECT {', '.join(columns)} FROM relays ORDER BY hostname").fetchall()
+    nrows      = len(rows)
+    nbytes     = (nrows + 7) // 8
+
+    sections = []   # raw bytes, in file order
+    header   = {}
+
+    def add_section(data):
+        sections.append(data)
+        return len(sections) - 1   # resolved to (offset, length) below
+
+    for pos, name in enumerate(columns):
+        values = [row[pos] for row in rows]
+
+        if name in STR_COLUMNS:
+            encoded = [(value or "").encode() for value in values]
+            offsets = [0]
+            for value in encoded:
+                offsets.append(offsets[-1] + len(value))
+            header[name] = {
+                "kind"    : "str",
+                "offsets" : add_section(struct.pack(f"<{nrows + 1}I", *offsets)),
+                "blob"    : add_section(b"".join(encoded)),
+                "nulls"   : [i for i, value in enumerate(values) if value is None],
+            }
+
+        elif name in DICT_COLUMNS:
+            distinct = sorted(set(values), key=lambda value: (value is None, value or ""))
+            codes    = {value: code for code, value in enumerate(distinct)}
+            members  = {value: [] for value in distinct}
+            for i, value in enumerate(values):
+                members[value].append(i)
+            header[name] = {
+                "kind"    : "dict",
+                "values"  : distinct,
+                "codes"   : add_section(struct.pack(f"<{nrows}H", *(codes[value] for value in values))),
+                "bitmaps" : [add_section(_bitmap(members[value], nbytes)) for value in distinct],
+            }
+
+        else:
+            flags = [_NULL_FLAG if value is None else int(value) for value in values]
+            header[name] = {
+                "kind"   : "flag",
+                "codes"  : add_section(bytes(flags)),
+                "ones"   : add_section(_bitmap((i for i, flag in enumerate(flags) if flag == 1), nbytes)),
+                "zeros"  : add_section(_bitmap((i for i, flag in enumerate(flags) if flag == 0), nbytes)),
+            }
+
+    # Section ids -> (offset, length) relative to the start of the data area, 8-byte aligned
+    locations, offset = [], 0
+    for data in sections:
+        locations.append((offset, len(data)))
+        offset += (len(data) + 7) // 8 * 8
+
+    def resolve(entry):
+        for key, value in entry.items():
+            if key in ("offsets", "blob", "codes", "ones", "zeros"):
+                entry[key] = locations[value]
+            elif key == "bitmaps":
+                entry[key] = [locations[section] for section in value]
+        return entry
+
+    header_bytes = json.dumps({name: resolve(entry) for name, entry in header.items()}).encode()
+    header_bytes += b" " * (-(_PREFIX.size + len(header_bytes)) % 8)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, VERSION, nrows, len(header_bytes), generation))
+        f.write(header_bytes)
+        for data in sections:
+            f.write(data)
+            f.write(b"\0" * (-len(data) % 8))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+## ------------- READING ------------- ##
+
+class Snapshot:
+    """Read-only view over a memory-mapped snapshot file."""
+
+    def __init__(self, mm):
+        magic, version, self.nrows, header_len, self.generation = _PREFIX.unpack_from(mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("unsupported snapshot format")
+        self._mm     = mm
+        self._view   = memoryview(mm)
+        self._header = json.loads(mm[_PREFIX.size:_PREFIX.size + header_len])
+        self._base   = _PREFIX.size + header_len
+        self._nbytes = (self.nrows + 7) // 8
+        self._all    = (1 << self.nrows) - 1
+
+    def _section(self, location):
+        offset, length = location
+        return self._view[self._base + offset:self._base + offset + length]
+
+    def _bits(self, location):
+        return int.from_bytes(self._section(location), "little")
+
+    def _column_bits(self, column, value):
+        """Bitmap of rows matching one `query` filter, using the same rules as the SQL path."""
+        entry = self._header[column]
+
+        if entry["kind"] == "flag":
+            key = {1: "ones", 0: "zeros"}.get(value)
+            return self._bits(entry[key]) if key else 0
+
+        if column in LIKE_COLUMNS:
+            pattern = _like_regex(value)
+            matches = lambda candidate: pattern.fullmatch(candidate)
+        else:
+            wanted  = str(value).translate(_ASCII_LOWER)
+            matches = lambda candidate: candidate.translate(_ASCII_LOWER) == wanted
+
+        bits = 0
+        for candidate, location in zip(entry["values"], entry["bitmaps"]):
+            if candidate is not None and matches(candidate):
+                bits |= self._bits(location)
+        return bits
+
+    def _rows(self, bits):
+        """Yields row indices whose bit is set, in row (hostname) order."""
+        for i, byte in enumerate(bits.to_bytes(self._nbytes, "little")):
+            if byte:
+                base = i * 8
+                for bit in _BYTE_BITS[byte]:
+                    yield base + bit
+
+    def _column_values(self, column, rows):
+        """Decodes `column` for the given row indices."""
+        entry = self._header[column]
+        if entry["kind"] == "str":
+            offsets = self._section(entry["offsets"]).cast("I")
+            blob    = self._section(entry["blob"])
+            values  = [str(blob[offsets[i]:offsets[i + 1]], "utf-8") for i in rows]
+            if entry["nulls"]:
+                nulls  = set(entry["nulls"])
+                values = [None if i in nulls else value for i, value in zip(rows, values)]
+            return values
+        if entry["kind"] == "dict":
+            codes, values = self._section(entry["codes"]).cast("H"), entry["values"]
+            return [values[codes[i]] for i in rows]
+        codes = self._section(entry["codes"])
+        return [None if codes[i] == _NULL_FLAG else codes[i] for i in rows]
+
+    def query(self, query_params, columns):
+        """Returns dicts of `columns` for rows matching all `query_params`, ordered by hostname."""
+        bits = self._all
+        for column, value in query_params.items():
+            bits &= self._column_bits(column, value)
+            if not bits:
+                return []
+
+        rows   = list(self._rows(bits))
+        values = [self._column_values(column, rows) for column in columns]
+        return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def _like_regex(value):
+    """Compiles SQLite `LIKE '%value%'` (ASCII case-insensitive, `%` and `_` wildcards) to a regex."""
+    pattern = "".join(
+        ".*" if char == "%" else "." if char == "_" else re.escape(char)
+        for char in f"%{value}%"
+    )
+    return re.compile(pattern, re.IGNORECASE | re.ASCII | re.DOTALL)
+
+def snapshot_generation(path):
+    """Reads only the database generation from the snapshot at `path`. Returns None if it is missing or unreadable."""
+    try:
+        with open(path, "rb") as f:
+            magic, version, _, _, generation = _PREFIX.unpack(f.read(_PREFIX.size))
+    except (OSError, struct.error):
+        return None
+    return generation if magic == MAGIC and version == VERSION else None
+
+def open_snapshot(path):
+    """Memory-maps the snapshot at `path`. Returns None if it is missing or unreadable."""
+    try:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return Snapshot(mm)
+    except (OSError, ValueError, struct.error):
+        return None
@@ -0,0 +1,40 @@
+"""
+Shared test setup.
+
+mull keeps its state (defaults.conf, relays.db, query_results.txt, ...) next to its
+own source files, so the tests import the modules from a throwaway copy of the tree
+instead of the checkout. `make_mull_home` builds such a copy, `MULL_HOME` is the one
+the test process imports from.
+"""
+import tempfile
+import shutil
+import sys
+import os
+
+REPO_DIR     = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_FILES = sorted(name for name in os.listdir(REPO_DIR) if name.endswith('.py')) + ['mull']
+
+DEFAULTS_CONF = """\
+[DATABASE]
+relay_database_path = relays.db
+
+[RELAYS]
+
+"""
+
+
+def make_mull_home(path):
+    """Copies the mull sources into `path` with a fresh defaults.conf, returns `path`."""
+    for name in SOURCE_FILES:
+        shutil.copy(os.path.join(REPO_DIR, name), path)
+    with open(os.path.join(path, 'defaults.conf'), 'w') as f:
+        f.write(DEFAULTS_CONF)
+    return path
+
+
+MULL_HOME = make_mull_home(tempfile.mkdtemp(prefix='mull-tests-'))
+sys.path.insert(0, MULL_HOME)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(MULL_HOME, ignore_errors=True)
@@ -0,0 +1,55 @@
+"""`mull batch`: per-line error reporting and the single deferred defaults.conf write."""
+import configparser
+import argparse
+import io
+
+import pytest
+
+pytest.importorskip("requests")  # ops.py imports it at module level
+
+import config
+import ops
+
+BATCH = """\
+# comment lines and blank lines are skipped
+
+add se-got-wg-001
+frobnicate
+query --country zz
+add not-a-relay
+add nl-ams-wg-002 -p 0
+"""
+
+
+@pytest.fixture
+def conf_writes(monkeypatch):
+    """Counts defaults.conf writes, still performing them."""
+    writes = []
+    write_config = ops.write_config
+    monkeypatch.setattr(ops, "write_config", lambda config: writes.append(1) or write_config(config))
+    monkeypatch.setattr(ops, "DEFAULT_RELAYS", [])
+    return writes
+
+
+def test_batch_reports_failing_lines_and_writes_defaults_once(conf_writes, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        ops.run_batch(argparse.Namespace(file=io.StringIO(BATCH)))
+    output = capsys.readouterr().out
+
+    # Only the unknown subcommand fails, `query` with no results exits 0 standalone
+    assert exit_info.value.code == 1
+    assert "[BATCH ERROR] line 4: `frobnicate` exited" in output
+    assert output.count("[BATCH ERROR]") == 1
+    assert "Batch finished: 5 commands, 1 failed" in output
+
+    assert ops.DEFAULT_RELAYS == ["nl-ams-wg-002", "se-got-wg-001"]
+    on_disk = configparser.ConfigParser()
+    on_disk.read(config.CONFIG_PATH)
+    assert list(dict(on_disk["RELAYS"]).values()) == ["nl-ams-wg-002", "se-got-wg-001"]
+    assert len(conf_writes) == 1
+
+
+def test_batch_of_successful_commands_exits_cleanly(conf_writes, capsys):
+    ops.run_batch(argparse.Namespace(file=io.StringIO("add de-fra-wg-001\nquery --country zz\n")))
+    assert "Batch finished: 2 commands, 0 failed" in capsys.readouterr().out
+    assert len(conf_writes) == 1
@@ -0,0 +1,65 @@
+"""Parallel `mull add` / `swap` processes must never lose updates to defaults.conf."""
+import configparser
+import subprocess
+import sqlite3
+import sys
+import os
+
+import pytest
+
+from conftest import make_mull_home
+from migrations import migrate
+
+pytest.importorskip("requests")  # ops.py imports it at module level
+
+WRITERS = 40
+
+
+@pytest.fixture
+def mull_home(tmp_path):
+    home = make_mull_home(str(tmp_path))
+    # `mull` runs `update` (network) when the database is missing
+    conn = sqlite3.connect(os.path.join(home, 'relays.db'))
+    migrate(conn)
+    conn.close()
+    return home
+
+
+def _run_parallel(home, commands):
+    procs = [
+        subprocess.Popen(
+            [sys.executable, os.path.join(home, 'mull'), *command],
+            cwd=home, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+        )
+        for command in commands
+    ]
+    for proc in procs:
+        output, _ = proc.communicate(timeout=120)
+        assert proc.returncode == 0, output
+
+
+def _default_relays(home):
+    config = configparser.ConfigParser()
+    config.read(os.path.join(home, 'defaults.conf'))
+    return list(dict(config['RELAYS']).values())
+
+
+def test_parallel_adds_lose_no_updates(mull_home):
+    relays = [f"se-got-wg-{i:03d}" for i in range(WRITERS)]
+    _run_parallel(mull_home, [['add', relay] for relay in relays])
+
+    defaults = _default_relays(mull_home)
+    assert sorted(defaults) == relays
+    assert not [name for name in os.listdir(mull_home) if name.startswith('.defaults.')
+                and name != '.defaults.conf.lock'], "temp files left behind"
+
+
+def test_parallel_adds_and_swaps_keep_every_relay(mull_home):
+    seed = [f"de-fra-wg-{i:03d}" for i in range(4)]
+    _run_parallel(mull_home, [['add', relay] for relay in seed])
+
+    added = [f"nl-ams-wg-{i:03d}" for i in range(WRITERS // 2)]
+    commands = [['add', relay] for relay in added] + [['swap', '0', '1'] for _ in range(WRITERS // 2)]
+    _run_parallel(mull_home, commands)
+
+    assert sorted(_default_relays(mull_home)) == sorted(seed + added)
@@ -0,0 +1,172 @@
+"""Endpoint family: the happy-eyeballs race, the endpoint_cache and the `wg set` that applies the winner."""
+import argparse
+import socket
+import json
+import time
+import sys
+import os
+
+import pytest
+
+import endpoints
+
+RELAY = "se-got-wg-001"
+
+
+def _listen_ipv6(port=0):
+    """TCP listener on [::1] only, 127.0.0.1 on the same port is left alone."""
+    try:
+        sock = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+        sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+        sock.bind(("::1", port))
+    except OSError:
+        pytest.skip("no IPv6 loopback")
+    sock.listen()
+    return sock
+
+
+@pytest.fixture
+def ipv6_listener():
+    """[::1] listener on a port that is closed on 127.0.0.1. Returns the port."""
+    sock = _listen_ipv6()
+    yield sock.getsockname()[1]
+    sock.close()
+
+
+@pytest.fixture
+def blackhole():
+    """127.0.0.1 port whose accept queue is full, so new SYNs are dropped and connects hang. Returns the port."""
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(0)
+    port    = listener.getsockname()[1]
+    backlog = []
+    for _ in range(4):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        sock.connect_ex(("127.0.0.1", port))
+        backlog.append(sock)
+    time.sleep(0.05)
+    yield port
+    for sock in backlog + [listener]:
+        sock.close()
+
+
+def test_listener_and_refused_port_both_answer(ipv6_listener):
+    # Loopback answers within the connect call itself, so the first family tried wins
+    family, rtt = endpoints.race({6: "::1", 4: "127.0.0.1"}, port=ipv6_listener)
+    assert family == 6 and rtt < endpoints.RACE_TIMEOUT
+    # A refused connection (RST) is an answer too, it does not lose to the listener
+    family, rtt = endpoints.race({4: "127.0.0.1", 6: "::1"}, port=ipv6_listener)
+    assert family == 4 and rtt < endpoints.RACE_TIMEOUT
+
+
+def test_silent_family_times_out(blackhole):
+    start   = time.monotonic()
+    winner  = endpoints.race({4: "127.0.0.1"}, port=blackhole)
+    elapsed = time.monotonic() - start
+    assert winner is None
+    assert endpoints.RACE_TIMEOUT <= elapsed < endpoints.RACE_TIMEOUT + 0.25
+
+
+def test_silent_family_loses_to_listener(blackhole):
+    # Same port number on both families: the blackhole on 127.0.0.1, a listener on [::1]
+    listener = _listen_ipv6(blackhole)
+    try:
+        family, rtt = endpoints.race({4: "127.0.0.1", 6: "::1"}, port=blackhole)
+    finally:
+        listener.close()
+    assert family == 6 and rtt < endpoints.RACE_TIMEOUT
+
+
+## ------------- ENDPOINT CACHE ------------- ##
+
+@pytest.fixture
+def ops():
+    pytest.importorskip("requests")  # ops.py imports it at module level
+    import ops
+    return ops
+
+
+@pytest.fixture
+def relay_db(ops, tmp_path, monkeypatch):
+    """relays.db holding RELAY with both addresses. Returns the list of race calls."""
+    monkeypatch.setattr(ops, "DATABASE_PATH", str(tmp_path / "relays.db"))
+    conn = ops._get_connection()
+    conn.execute("INSERT INTO countries (country_code, country_name) VALUES ('se', 'Sweden')")
+    conn.execute("INSERT INTO cities (country_id, city_code, city_name) VALUES (1, 'got', 'Gothenburg')")
+    conn.execute("""
+        INSERT INTO relay_data (hostname, city_id, active, ipv4_addr_in, ipv6_addr_in)
+        VALUES (?, 1, 1, '185.213.154.68', '2a03:1b20:5:f011::a01f')
+    """, (RELAY,))
+    conn.commit()
+    conn.close()
+
+    races = []
+    monkeypatch.setattr(ops.endpoints, "race", lambda addresses: races.append(addresses) or (6, 0.012))
+    return races
+
+
+def test_cached_winner_is_reused_within_ttl(ops, relay_db, monkeypatch):
+    now = 1760860800
+    monkeypatch.setattr(ops.time, "time", lambda: now)
+    assert ops._select_endpoint(RELAY, 'auto') == "2a03:1b20:5:f011::a01f"
+    assert relay_db == [{4: "185.213.154.68", 6: "2a03:1b20:5:f011::a01f"}]
+
+    now += ops.ENDPOINT_CACHE_TTL - 1
+    assert ops._select_endpoint(RELAY, 'auto') == "2a03:1b20:5:f011::a01f"
+    assert len(relay_db) == 1
+
+    now += 1
+    assert ops._select_endpoint(RELAY, 'auto') == "2a03:1b20:5:f011::a01f"
+    assert len(relay_db) == 2
+
+
+def test_forced_family_skips_the_race(ops, relay_db):
+    assert ops._select_endpoint(RELAY, '4') == "185.213.154.68"
+    assert relay_db == []
+
+
+## ------------- APPLYING THE WINNER ------------- ##
+
+WG_DUMP = (
+    "cHJpdmF0ZQ==\tcHVibGlj\t51820\toff\n"
+    "UEVFUg==\t(none)\t185.213.154.68:51820\t0.0.0.0/0,::/0\t0\t0\t0\toff\n"
+)
+
+RECORDER = """\
+#!{python}
+import json, os, sys
+argv = [os.path.basename(sys.argv[0]), *sys.argv[1:]]
+with open(os.environ['FAKE_LOG'], 'a') as f:
+    f.write(json.dumps(argv) + '\\n')
+if argv[:2] == ['wg', 'show']:
+    sys.stdout.write({dump!r})
+"""
+
+
+@pytest.fixture
+def fake_bin(tmp_path, monkeypatch):
+    """PATH with a pass-through `sudo` and recording wg/wg-quick (`wg show` prints WG_DUMP). Returns a log reader."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "sudo").write_text('#!/bin/sh\nexec "$@"\n')
+    for name in ("wg", "wg-quick"):
+        (bin_dir / name).write_text(RECORDER.format(python=sys.executable, dump=WG_DUMP))
+    for script in bin_dir.iterdir():
+        script.chmod(0o755)
+
+    log = tmp_path / "commands.log"
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_LOG", str(log))
+    return lambda: [json.loads(line) for line in log.read_text().splitlines()]
+
+
+def test_wg_quick_up_points_peer_at_winner(ops, fake_bin):
+    args = argparse.Namespace(action='up', verbose=False, engine='wg-quick')
+    assert ops._handle_relay(args, RELAY, "::1")
+    assert fake_bin() == [
+        ['wg-quick', 'up', RELAY],
+        ['wg', 'show', RELAY, 'dump'],
+        ['wg', 'set', RELAY, 'peer', 'UEVFUg==', 'endpoint', '[::1]:51820'],
+    ]
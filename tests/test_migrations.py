@@ -0,0 +1,96 @@
+"""Schema migrations: upgrading in place and concurrent first opens."""
+import threading
+import sqlite3
+
+import pytest
+
+from migrations import migrate, MIGRATIONS, SCHEMA_VERSION
+
+
+def _version(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_concurrent_migrations_apply_each_step_once(tmp_path):
+    path    = str(tmp_path / "relays.db")
+    workers = 8
+    barrier = threading.Barrier(workers)
+    errors  = []
+
+    def open_and_migrate():
+        conn = sqlite3.connect(path, timeout=30)
+        try:
+            barrier.wait()
+            migrate(conn)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=open_and_migrate) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert _version(path) == SCHEMA_VERSION
+
+
+def test_flat_v1_database_upgrades_in_place(tmp_path):
+    path = str(tmp_path / "relays.db")
+    conn = sqlite3.connect(path)
+    cur  = conn.cursor()
+    MIGRATIONS[0](cur)
+    cur.execute("PRAGMA user_version = 1")
+    cur.execute("""
+        INSERT INTO relays (hostname, country_code, country_name, city_code, city_name, active, provider)
+        VALUES ('se-got-wg-001', 'se', 'Sweden', 'got', 'Gothenburg', 1, NULL)
+    """)
+    conn.commit()
+
+    migrate(conn)
+
+    row = conn.execute("SELECT hostname, country_name, city_name, active, provider FROM relays").fetchall()
+    assert row == [('se-got-wg-001', 'Sweden', 'Gothenburg', 1, None)]
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    conn.close()
+
+
+def test_locked_database_reports_lock_error(tmp_path):
+    path   = str(tmp_path / "relays.db")
+    holder = sqlite3.connect(path, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")
+    conn = sqlite3.connect(path, timeout=0.1)
+    try:
+        with pytest.raises(sqlite3.OperationalError, match="database is locked"):
+            migrate(conn)
+        assert not conn.in_transaction
+    finally:
+        conn.close()
+        holder.execute("ROLLBACK")
+        holder.close()
+    assert _version(path) == 0
+
+
+def test_selective_provider_filter_uses_index(tmp_path):
+    """With Mullvad-like spread (~30 relays per provider) the planner drives `--provider` through the index."""
+    conn = sqlite3.connect(str(tmp_path / "relays.db"))
+    migrate(conn)
+    conn.execute("INSERT INTO countries (country_code, country_name) VALUES ('se', 'Sweden')")
+    conn.execute("INSERT INTO cities (country_id, city_code, city_name) VALUES (1, 'got', 'Gothenburg')")
+    conn.executemany("INSERT INTO providers (provider) VALUES (?)", [(f"provider{i}",) for i in range(25)])
+    conn.executemany(
+        "INSERT INTO relay_data (hostname, city_id, provider_id) VALUES (?, 1, ?)",
+        [(f"se-got-wg-{i:03d}", i % 25 + 1) for i in range(750)]
+    )
+    conn.execute("ANALYZE")
+    plan = " ".join(row[-1] for row in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT hostname FROM relays WHERE provider COLLATE NOCASE = 'provider3'"
+    ))
+    conn.close()
+    assert "relay_data_provider" in plan
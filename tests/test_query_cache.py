@@ -0,0 +1,70 @@
+"""Query result cache: key folding, LRU eviction, generation changes and read-only hits."""
+import os
+
+from query_cache import QueryCache, cache_key
+
+ROWS = [{"hostname": "se-got-wg-001", "active": 1}, {"hostname": "se-got-wg-002", "active": 0}]
+
+
+def _files(directory):
+    return sorted(name for name in os.listdir(directory) if not name.startswith('.tmp.'))
+
+
+def _age(cache, query_params, mtime):
+    """Sets the last use of a cached entry to `mtime` (unix seconds)."""
+    os.utime(cache._entry_path(cache_key(query_params)), (mtime, mtime))
+
+
+def test_cache_key_folds_ascii_case_only():
+    assert cache_key({"country_name": "SWEDEN", "active": 1}) == cache_key({"active": 1, "country_name": "sweden"})
+    assert cache_key({"city_name": "MALMÖ"}) != cache_key({"city_name": "malmö"})
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = QueryCache(str(tmp_path), generation=1, size=3)
+    for code in ("se", "dk", "ch"):
+        cache.put({"country_code": code}, ROWS)
+    cache.save()
+    for mtime, code in enumerate(("se", "dk", "ch")):
+        _age(cache, {"country_code": code}, 1760860800 + mtime)
+
+    cache = QueryCache(str(tmp_path), generation=1, size=3)
+    assert cache.get({"country_code": "se"}) == ROWS   # se is now the most recently used
+    cache.put({"country_code": "us"}, ROWS)
+    cache.save()
+
+    cache = QueryCache(str(tmp_path), generation=1, size=3)
+    assert sorted(cache.keys) == sorted(cache_key({"country_code": code}) for code in ("se", "ch", "us"))
+    assert cache.get({"country_code": "dk"}) is None
+    assert len(_files(tmp_path)) == 3 + 1   # entries + index.json
+
+
+def test_new_generation_drops_and_prunes_older_entries(tmp_path):
+    cache = QueryCache(str(tmp_path), generation=1)
+    cache.put({"country_code": "se"}, ROWS)
+    cache.put({"country_code": "dk"}, ROWS)
+    cache.save()
+
+    cache = QueryCache(str(tmp_path), generation=2)
+    assert cache.get({"country_code": "se"}) is None
+    cache.put({"country_code": "se"}, ROWS[:1])
+    cache.save()
+    assert _files(tmp_path) == sorted([os.path.basename(cache._entry_path(cache_key({"country_code": "se"}))), "index.json"])
+
+    # The older generation is gone for readers still on it too
+    assert QueryCache(str(tmp_path), generation=1).get({"country_code": "dk"}) is None
+    assert QueryCache(str(tmp_path), generation=2).get({"country_code": "se"}) == ROWS[:1]
+
+
+def test_hit_writes_nothing(tmp_path):
+    cache = QueryCache(str(tmp_path), generation=1)
+    cache.put({"country_code": "se"}, ROWS)
+    cache.save()
+    index = tmp_path / "index.json"
+    os.utime(index, (1760860800, 1760860800))
+
+    cache = QueryCache(str(tmp_path), generation=1)
+    assert cache.get({"country_code": "SE"}) == ROWS
+    cache.save()
+    assert index.stat().st_mtime == 1760860800
+    assert _files(tmp_path) == sorted([os.path.basename(cache._entry_path(cache_key({"country_code": "se"}))), "index.json"])
@@ -0,0 +1,87 @@
+"""Session stats: folding sessions into relay_stats and timing the first handshake."""
+import pytest
+
+pytest.importorskip("requests")  # ops.py imports it at module level
+
+import ops
+
+RELAY = "se-got-wg-001"
+
+WG_DUMP = (
+    "cHJpdmF0ZQ==\tcHVibGlj\t51820\toff\n"
+    "UEVFUg==\t(none)\t185.213.154.68:51820\t0.0.0.0/0,::/0\t1760860800\t92840\t14672\toff\n"
+)
+
+
+def _peer(latest_handshake, rx=1000, tx=500):
+    return {"public_key": "UEVFUg==", "endpoint": "185.213.154.68:51820",
+            "latest_handshake": latest_handshake, "rx": rx, "tx": tx}
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Fresh relays.db for the session tables, returns a reader for RELAY's relay_stats row."""
+    monkeypatch.setattr(ops, "DATABASE_PATH", str(tmp_path / "relays.db"))
+
+    def stats():
+        conn = ops._get_connection()
+        row  = conn.execute("SELECT * FROM relay_stats WHERE hostname = ?;", (RELAY,)).fetchone()
+        conn.close()
+        return dict(row) if row else None
+    return stats
+
+
+def _open_session(started_at, first_handshake):
+    conn = ops._get_connection()
+    conn.execute("INSERT INTO active_sessions (interface, started_at, first_handshake) VALUES (?, ?, ?);",
+                 (RELAY, started_at, first_handshake))
+    conn.commit()
+    conn.close()
+
+
+def test_end_session_accumulates_and_averages_first_handshake(db, monkeypatch):
+    monkeypatch.setattr(ops.time, "time", lambda: 1000.0)
+    _open_session(started_at=900.0, first_handshake=1.0)
+    ops._end_session(RELAY, [_peer(990)])
+    assert db() == {
+        "hostname": RELAY, "sessions": 1, "handshake_failures": 0, "total_seconds": 100.0,
+        "total_rx": 1000, "total_tx": 500, "avg_first_handshake": 1.0, "last_used": 1000,
+    }
+
+    monkeypatch.setattr(ops.time, "time", lambda: 2000.0)
+    _open_session(started_at=1950.0, first_handshake=2.0)
+    ops._end_session(RELAY, [_peer(1990, rx=10, tx=20)])
+    stats = db()
+    assert stats["sessions"] == 2
+    assert stats["total_seconds"] == 150.0
+    assert (stats["total_rx"], stats["total_tx"]) == (1010, 520)
+    assert stats["avg_first_handshake"] == pytest.approx(0.8 * 1.0 + 0.2 * 2.0)
+    assert stats["last_used"] == 2000
+
+    # No handshake at all: counted as a failure, the average is left alone
+    _open_session(started_at=1990.0, first_handshake=None)
+    ops._end_session(RELAY, [_peer(0)])
+    stats = db()
+    assert (stats["sessions"], stats["handshake_failures"]) == (3, 1)
+    assert stats["avg_first_handshake"] == pytest.approx(1.2)
+
+
+def test_end_session_without_open_session_counts_nothing(db):
+    ops._end_session(RELAY, [_peer(990)])
+    assert db() is None
+
+
+def test_wait_for_handshake_returns_once_seen(monkeypatch):
+    dumps  = iter([None, WG_DUMP.replace("1760860800", "0"), WG_DUMP])  # gone, not yet handshaked, handshaked
+    nudges = []
+    monkeypatch.setattr(ops, "_get_wg_dump", lambda relay: next(dumps))
+    monkeypatch.setattr(ops, "_nudge_tunnel", lambda: nudges.append(1))
+    monkeypatch.setattr(ops.time, "sleep", lambda seconds: None)
+    assert ops._wait_for_handshake(RELAY, timeout=3) is not None
+    assert len(nudges) == 1
+
+
+def test_wait_for_handshake_skips_nudge_when_already_handshaked(monkeypatch):
+    monkeypatch.setattr(ops, "_get_wg_dump", lambda relay: WG_DUMP)
+    monkeypatch.setattr(ops, "_nudge_tunnel", lambda: pytest.fail("handshake already seen"))
+    assert ops._wait_for_handshake(RELAY, timeout=3) < 0.1
@@ -0,0 +1,88 @@
+"""The columnar snapshot must answer `query` exactly like the SQL path of `_select_relays`."""
+import sqlite3
+import random
+
+import pytest
+
+pytest.importorskip("requests")  # ops.py imports it at module level
+
+import ops
+from migrations import migrate
+from snapshot import write_snapshot, open_snapshot
+
+FILTER_SETS = 1000
+
+# Mixed case, non-ASCII (NOCASE/LIKE fold ASCII only) and LIKE metacharacters in the data itself
+COUNTRIES = [("se", "Sweden"), ("SE2", "sweden north"), ("dk", "Danmark"), ("ch", "ÅLAND 100%"), ("us", "USA_east")]
+CITIES    = ["Malmö", "MALMO", "Gothenburg", "new_york", "Zürich", "ZURICH", "50%off"]
+PROVIDERS = ["M247", "m247", "xtom", "DataPacket", None]
+
+
+@pytest.fixture(scope="module")
+def catalog(tmp_path_factory):
+    """Synthetic relays.db + relays.snap built through the real migrations and snapshot writer."""
+    rng  = random.Random(20261019)
+    path = tmp_path_factory.mktemp("snapshot")
+    conn = sqlite3.connect(path / "relays.db")
+    migrate(conn)
+
+    for country_code, country_name in COUNTRIES:
+        conn.execute("INSERT INTO countries (country_code, country_name) VALUES (?, ?)", (country_code, country_name))
+    for country_id in range(1, len(COUNTRIES) + 1):
+        for code, name in enumerate(rng.sample(CITIES, 3)):
+            conn.execute("INSERT INTO cities (country_id, city_code, city_name) VALUES (?, ?, ?)",
+                         (country_id, f"c{code}{'x' if code % 2 else 'X'}", name))
+    for provider in PROVIDERS:
+        if provider is not None:
+            conn.execute("INSERT INTO providers (provider) VALUES (?)", (provider,))
+
+    city_count = conn.execute("SELECT COUNT(*) FROM cities").fetchone()[0]
+    for i in range(600):
+        provider = rng.choice(PROVIDERS)
+        conn.execute("""
+            INSERT INTO relay_data (hostname, city_id, provider_id, active, owned, daita, status_messages)
+            VALUES (?, ?, (SELECT provider_id FROM providers WHERE provider = ?), ?, ?, ?, ?)
+        """, (
+            f"{rng.choice('abcd')}{rng.choice('xyz')}-{rng.choice(['got', 'MMA', 'fra'])}-wg-{i:03d}",
+            rng.randrange(1, city_count + 1), provider,
+            rng.choice([0, 1, 1, None]), rng.choice([0, 1]), rng.choice([0, 1, None]),
+            rng.choice(["", None, "[2025] maintenance"]),
+        ))
+    conn.commit()
+    write_snapshot(conn, str(path / "relays.snap"))
+    conn.close()
+    return path
+
+
+def _random_filters(rng):
+    """One `query` filter set, as `query_database` builds it (code vs. name already resolved)."""
+    candidates = {
+        "country_code" : lambda: rng.choice(["se", "SE", "Se", "se2", "dk", "CH", "zz", "s_"]),
+        "country_name" : lambda: rng.choice(["swe", "SWEDEN", "den", "%", "_", "a_a", "100%", "åland", "ÅLAND", "usa_e", "usa e", ""]),
+        "city_code"    : lambda: rng.choice(["c0X", "c0x", "C1X", "c2X", "c_x", "c9x"]),
+        "city_name"    : lambda: rng.choice(["malm", "MALM", "malmö", "MALMÖ", "zür", "zurich", "new_y", "new%k", "50%", "_", "0%o"]),
+        "provider"     : lambda: rng.choice(["M247", "m247", "XTOM", "datapacket", "none", "%"]),
+        "active"       : lambda: rng.choice([0, 1]),
+        "owned"        : lambda: rng.choice([0, 1]),
+        "daita"        : lambda: rng.choice([0, 1]),
+    }
+    columns = rng.sample(sorted(candidates), rng.randint(1, 4))
+    return {column: candidates[column]() for column in columns}
+
+
+def test_snapshot_matches_sql(catalog, monkeypatch):
+    monkeypatch.setattr(ops, "DATABASE_PATH", str(catalog / "relays.db"))
+    monkeypatch.setattr(ops, "SNAPSHOT_PATH", str(catalog / "missing.snap"))  # force the SQL path
+    snap = open_snapshot(str(catalog / "relays.snap"))
+    assert snap is not None
+
+    rng = random.Random(7)
+    for _ in range(FILTER_SETS):
+        query_params = _random_filters(rng)
+        assert snap.query(query_params, ops.QUERY_RESULT_COLUMNS) == ops._select_relays(query_params), query_params
+
+
+def test_select_relays_prefers_snapshot(catalog, monkeypatch):
+    monkeypatch.setattr(ops, "SNAPSHOT_PATH", str(catalog / "relays.snap"))
+    monkeypatch.setattr(ops, "_get_connection", lambda: pytest.fail("unsorted queries must not open SQLite"))
+    assert ops._select_relays({"country_code": "se"})
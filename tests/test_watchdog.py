@@ -0,0 +1,90 @@
+"""Watchdog: `wg show dump` parsing, the stale/stall decision and when failover gives up."""
+import argparse
+
+import pytest
+
+pytest.importorskip("requests")  # ops.py imports it at module level
+
+import ops
+
+# `wg show se-got-wg-001 dump`: interface line, then one tab separated line per peer
+WG_DUMP = (
+    "cHJpdmF0ZQ==\tcHVibGlj\t51820\toff\n"
+    "UEVFUg==\t(none)\t185.213.154.68:51820\t0.0.0.0/0,::/0\t1760860800\t92840\t14672\toff\n"
+)
+
+
+def _peer(latest_handshake=1760860800, rx=92840):
+    return {"public_key": "UEVFUg==", "endpoint": "185.213.154.68:51820",
+            "latest_handshake": latest_handshake, "rx": rx, "tx": 14672}
+
+
+def test_parse_wg_dump():
+    assert ops._parse_wg_dump(WG_DUMP) == [_peer()]
+
+
+def test_parse_wg_dump_skips_interface_and_short_lines():
+    assert ops._parse_wg_dump("cHJpdmF0ZQ==\tcHVibGlj\t51820\toff\n") == []
+    assert ops._parse_wg_dump(WG_DUMP + "truncated\tline\n") == [_peer()]
+
+
+@pytest.mark.parametrize("peer, since, rx_changed, now, wall_now, expected", [
+    # recent handshake, traffic flowing
+    (_peer(), 0, 95, 100, 1760860800 + 30, None),
+    # handshake older than --stale
+    (_peer(), 0, 95, 100, 1760860800 + 181, "handshake stale (181s)"),
+    # handshake fine, nothing received for longer than --stall
+    (_peer(), 0, 89, 100, 1760860800 + 30, "no traffic received (11s)"),
+    # never handshaked: age counts from when watching started
+    (_peer(latest_handshake=0), 0, 95, 100, 0, None),
+    (_peer(latest_handshake=0), 0, 195, 200, 0, "handshake stale (200s)"),
+])
+def test_tunnel_fault(peer, since, rx_changed, now, wall_now, expected):
+    assert ops._tunnel_fault(peer, since, rx_changed, stale=180, stall=10, now=now, wall_now=wall_now) == expected
+
+
+@pytest.fixture
+def no_tunnel_changes(monkeypatch):
+    """Records `_disconnect` / `_handle_relay` calls instead of running them."""
+    calls = []
+    monkeypatch.setattr(ops, "_disconnect", lambda *args, **kwargs: calls.append("down") or True)
+    monkeypatch.setattr(ops, "_handle_relay", lambda *args, **kwargs: calls.append("up") or True)
+    return calls
+
+
+def _watchdog_args(source):
+    return argparse.Namespace(source=source, engine='wg-quick', handshake_timeout=1, interval=0,
+                              stale=180, stall=10, force=True)
+
+
+def test_failover_without_candidates_keeps_tunnel_up(monkeypatch, no_tunnel_changes):
+    monkeypatch.setattr(ops, "DEFAULT_RELAYS", ["se-got-wg-001"])  # only the relay being watched
+    assert ops._failover(_watchdog_args('defaults'), "se-got-wg-001", "handshake stale (181s)") is None
+    assert no_tunnel_changes == []
+
+
+def test_watchdog_rejects_missing_results_before_watching(monkeypatch, tmp_path, no_tunnel_changes):
+    monkeypatch.setattr(ops, "QUERY_RESULTS_FILE_PATH", str(tmp_path / "query_results.txt"))
+    monkeypatch.setattr(ops, "_get_active_relays", lambda: pytest.fail("source must be checked first"))
+    with pytest.raises(SystemExit) as exit_info:
+        ops.run_watchdog(_watchdog_args('results'))
+    assert exit_info.value.code == 1
+    assert no_tunnel_changes == []
+
+
+def test_failover_stops_when_teardown_fails(monkeypatch, no_tunnel_changes):
+    monkeypatch.setattr(ops, "DEFAULT_RELAYS", ["se-got-wg-001", "se-got-wg-002"])
+    monkeypatch.setattr(ops, "_disconnect", lambda *args, **kwargs: no_tunnel_changes.append("down") or False)
+    assert ops._failover(_watchdog_args('defaults'), "se-got-wg-001", "handshake stale (181s)") is None
+    assert no_tunnel_changes == ["down"]
+    with open(ops.WATCHDOG_LOG_PATH) as f:
+        assert f.read().splitlines()[-1].split("\t")[1:4] == ["se-got-wg-001", "FAILED", "handshake stale (181s)"]
+
+
+def test_failover_stops_when_candidate_teardown_fails(monkeypatch, no_tunnel_changes):
+    downs = iter([True, False])
+    monkeypatch.setattr(ops, "DEFAULT_RELAYS", ["se-got-wg-001", "se-got-wg-002", "se-got-wg-003"])
+    monkeypatch.setattr(ops, "_disconnect", lambda *args, **kwargs: no_tunnel_changes.append("down") or next(downs))
+    monkeypatch.setattr(ops, "_start_session", lambda relay, timeout: None)  # no handshake from the candidate
+    assert ops._failover(_watchdog_args('defaults'), "se-got-wg-001", "handshake stale (181s)") is None
+    assert no_tunnel_changes == ["down", "up", "down"]  # se-got-wg-003 is never brought up
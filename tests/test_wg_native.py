@@ -0,0 +1,140 @@
+"""Native engine: exact command plans and their execution through recording fake binaries."""
+import subprocess
+import json
+import sys
+import os
+
+import pytest
+
+import wg_native
+
+RELAY = "se-got-wg-001"
+
+# What Mullvad's config generator produces for a dual-stack single-hop relay
+MULLVAD_CONFIG = """\
+[Interface]
+# Device: Happy Cat
+PrivateKey = cHJpdmF0ZWtleQ==
+Address = 10.68.12.34/32,fc00:bbbb:bbbb:bb01::5:c21/128
+DNS = 10.64.0.1
+
+[Peer]
+PublicKey = UEVFUg==
+AllowedIPs = 0.0.0.0/0,::0/0
+Endpoint = 185.213.154.68:51820
+"""
+
+# Kill-switch variant: hooks must go through wg-quick on both `up` and `down`
+KILL_SWITCH_CONFIG = MULLVAD_CONFIG.replace(
+    "DNS = 10.64.0.1\n",
+    "DNS = 10.64.0.1\n"
+    "PostUp = iptables -I OUTPUT ! -o %i -m mark ! --mark $(wg show %i fwmark) -j REJECT\n"
+    "PreDown = iptables -D OUTPUT ! -o %i -m mark ! --mark $(wg show %i fwmark) -j REJECT\n",
+)
+
+RULES = "rule add not fwmark 51820 table 51820\nrule add table main suppress_prefixlength 0\n"
+
+EXPECTED_UP_PLAN = [
+    (['ip', 'link', 'add', 'dev', RELAY, 'type', 'wireguard'], None, True),
+    (['wg', 'set', RELAY, 'fwmark', '51820', 'private-key', '/dev/stdin',
+      'peer', 'UEVFUg==', 'endpoint', '185.213.154.68:51820', 'allowed-ips', '0.0.0.0/0,::0/0'],
+     "cHJpdmF0ZWtleQ==\n", True),
+    (['ip', '-4', '-batch', '-'],
+     f"address add 10.68.12.34/32 dev {RELAY}\n"
+     f"link set mtu 1420 up dev {RELAY}\n"
+     f"route add 0.0.0.0/0 dev {RELAY} table 51820\n" + RULES, True),
+    (['ip', '-6', '-batch', '-'],
+     f"address add fc00:bbbb:bbbb:bb01::5:c21/128 dev {RELAY}\n"
+     f"route add ::0/0 dev {RELAY} table 51820\n" + RULES, True),
+    (['sysctl', '-q', 'net.ipv4.conf.all.src_valid_mark=1'], None, True),
+    (['resolvconf', '-a', f'tun.{RELAY}', '-m', '0', '-x'], "nameserver 10.64.0.1\n", True),
+]
+
+EXPECTED_DOWN_PLAN = [
+    (['ip', '-force', '-4', '-batch', '-'],
+     "rule delete table 51820\nrule delete table main suppress_prefixlength 0\n", False),
+    (['ip', '-force', '-6', '-batch', '-'],
+     "rule delete table 51820\nrule delete table main suppress_prefixlength 0\n", False),
+    (['ip', 'link', 'delete', 'dev', RELAY], None, True),
+    (['resolvconf', '-d', f'tun.{RELAY}', '-f'], None, False),
+]
+
+
+def test_up_plan_for_mullvad_dual_stack_config():
+    assert wg_native.up_plan(RELAY, wg_native.parse_config(MULLVAD_CONFIG)) == EXPECTED_UP_PLAN
+
+
+def test_down_plan():
+    assert wg_native.down_plan(RELAY) == EXPECTED_DOWN_PLAN
+
+
+@pytest.mark.parametrize("action", [wg_native.up, wg_native.down])
+def test_hook_configs_fall_back_in_both_directions(monkeypatch, action):
+    monkeypatch.setattr(wg_native, "read_config", lambda relay: KILL_SWITCH_CONFIG)
+    monkeypatch.setattr(wg_native, "_run", lambda *args, **kwargs: pytest.fail("no command may run"))
+    with pytest.raises(wg_native.UnsupportedConfig):
+        action(RELAY)
+
+
+## ------------- RECORDING FAKE BINARIES ------------- ##
+
+RECORDER = """\
+#!{python}
+import json, os, sys
+name = os.path.basename(sys.argv[0])
+argv = [name, *sys.argv[1:]]
+# Only read stdin where the real tool would, anything else inherits the test's stdin
+reads_stdin = '-' in argv or '/dev/stdin' in argv or argv[:2] == ['resolvconf', '-a']
+stdin = sys.stdin.read() if reads_stdin else None
+with open(os.environ['FAKE_LOG'], 'a') as f:
+    f.write(json.dumps([argv, stdin]) + '\\n')
+sys.exit(1 if name == os.environ.get('FAKE_FAIL') else 0)
+"""
+
+
+@pytest.fixture
+def fake_bin(tmp_path, monkeypatch):
+    """PATH with a pass-through `sudo` and recording ip/wg/sysctl/resolvconf. Returns a reader for the log."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "sudo").write_text('#!/bin/sh\nexec "$@"\n')
+    for name in ("ip", "wg", "sysctl", "resolvconf"):
+        (bin_dir / name).write_text(RECORDER.format(python=sys.executable))
+    for script in bin_dir.iterdir():
+        script.chmod(0o755)
+
+    log = tmp_path / "commands.log"
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_LOG", str(log))
+    monkeypatch.setattr(wg_native, "read_config", lambda relay: MULLVAD_CONFIG)
+
+    def recorded():
+        if not log.exists():
+            return []
+        return [tuple(json.loads(line)) for line in log.read_text().splitlines()]
+    return recorded
+
+
+def _as_recorded(plan):
+    return [(argv, stdin) for argv, stdin, _ in plan]
+
+
+def test_run_executes_plan_under_sudo(fake_bin):
+    wg_native.up(RELAY)
+    wg_native.down(RELAY)
+    assert fake_bin() == _as_recorded(EXPECTED_UP_PLAN) + _as_recorded(EXPECTED_DOWN_PLAN)
+
+
+def test_failed_up_rolls_back(fake_bin, monkeypatch):
+    monkeypatch.setenv("FAKE_FAIL", "wg")
+    with pytest.raises(subprocess.CalledProcessError):
+        wg_native.up(RELAY)
+    assert fake_bin() == _as_recorded(EXPECTED_UP_PLAN[:2]) + _as_recorded(EXPECTED_DOWN_PLAN)
+
+
+def test_down_without_readable_config_still_tears_down(fake_bin, monkeypatch):
+    def missing(relay):
+        raise FileNotFoundError(relay)
+    monkeypatch.setattr(wg_native, "read_config", missing)
+    wg_native.down(RELAY)
+    assert fake_bin() == _as_recorded(EXPECTED_DOWN_PLAN)
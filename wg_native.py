@@ -0,0 +1,200 @@
+"""
+Brings WireGuard relays up and down without the wg-quick shell script.
+
+Reads /etc/wireguard/<relay>.conf and applies it with a fixed, batched set of
+commands: one `ip link`, one `wg set`, one `ip -batch` per address family, one
+`sysctl` and one `resolvconf`. Routing mirrors wg-quick's default-route setup:
+a default route in its own table plus `not fwmark` / `suppress_prefixlength 0`
+policy rules.
+
+Configs using features this engine does not implement (hooks, Table, SaveConfig,
+PresharedKey) raise `UnsupportedConfig` so the caller can fall back to wg-quick.
+"""
+import subprocess
+import ipaddress
+
+WG_CONFIG_DIR = "/etc/wireguard"
+FWMARK        = 51820   # also used as the routing table id, like wg-quick
+DEFAULT_MTU   = 1420
+
+UNSUPPORTED_KEYS = {"preup", "postup", "predown", "postdown", "table", "saveconfig", "presharedkey"}
+LIST_KEYS        = {"address", "dns", "allowedips"}
+
+
+class UnsupportedConfig(ValueError):
+    """Raised for WireGuard configs the native engine cannot apply."""
+
+
+## ------------- CONFIG ------------- ##
+
+def read_config(relay):
+    """Returns the text of /etc/wireguard/<relay>.conf, via `sudo cat` if it is root-only."""
+    path = f"{WG_CONFIG_DIR}/{relay}.conf"
+    try:
+        with open(path) as f:
+            return f.read()
+    except PermissionError:
+        return subprocess.run(
+            ['sudo', 'cat', path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True
+        ).stdout
+
+def parse_config(text):
+    """
+    Parses a wg-quick style config into {"interface": {...}, "peers": [{...}]}.
+    Keys are lower-cased; Address, DNS and AllowedIPs become lists.
+    """
+    config  = {"interface": {}, "peers": []}
+    section = None
+    for line in text.splitlines():
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        if line.startswith('['):
+            name = line.strip('[]').strip().lower()
+            if name == "interface":
+                section = config["interface"]
+            elif name == "peer":
+                section = {}
+                config["peers"].append(section)
+            else:
+                raise UnsupportedConfig(f"unknown section [{name}]")
+            continue
+
+        key, _, value = (part.strip() for part in line.partition('='))
+        key = key.lower()
+        if section is None:
+            raise UnsupportedConfig(f"`{key}` outside of a section")
+        if key in UNSUPPORTED_KEYS:
+            raise UnsupportedConfig(f"`{key}` is not supported by the native engine")
+        if key in LIST_KEYS:
+            section.setdefault(key, []).extend(item.strip() for item in value.split(',') if item.strip())
+        else:
+            section[key] = value
+
+    if "privatekey" not in config["interface"] or not config["peers"]:
+        raise UnsupportedConfig("config needs a PrivateKey and at least one [Peer]")
+    return config
+
+
+## ------------- COMMAND PLANS ------------- ##
+
+def _family(network):
+    return ipaddress.ip_network(network, strict=False).version
+
+def up_plan(relay, config):
+    """Returns the (argv, stdin, check) commands that bring `relay` up. Every command runs under sudo."""
+    interface = config["interface"]
+    peers     = config["peers"]
+    plan      = [(['ip', 'link', 'add', 'dev', relay, 'type', 'wireguard'], None, True)]
+
+    # Keys, peers and fwmark in one `wg set`, private key passed on stdin
+    wg_set = ['wg', 'set', relay, 'fwmark', str(FWMARK), 'private-key', '/dev/stdin']
+    if "listenport" in interface:
+        wg_set += ['listen-port', interface["listenport"]]
+    for peer in peers:
+        wg_set += ['peer', peer["publickey"]]
+        if "endpoint" in peer:
+            wg_set += ['endpoint', peer["endpoint"]]
+        if "persistentkeepalive" in peer:
+            wg_set += ['persistent-keepalive', peer["persistentkeepalive"]]
+        wg_set += ['allowed-ips', ','.join(peer.get("allowedips", []))]
+    plan.append((wg_set, interface["privatekey"] + "\n", True))
+
+    # Addresses, link and routes, one `ip -batch` per family
+    allowed  = [network for peer in peers for network in peer.get("allowedips", [])]
+    batches  = {4: [], 6: []}
+    defaults = set()
+    for address in interface.get("address", []):
+        batches[_family(address)].append(f"address add {address} dev {relay}")
+    batches[4].append(f"link set mtu {interface.get('mtu', DEFAULT_MTU)} up dev {relay}")
+    for network in allowed:
+        version = _family(network)
+        if ipaddress.ip_network(network, strict=False).prefixlen == 0:
+            defaults.add(version)
+            batches[version] += [
+                f"route add {network} dev {relay} table {FWMARK}",
+                f"rule add not fwmark {FWMARK} table {FWMARK}",
+                "rule add table main suppress_prefixlength 0",
+            ]
+        else:
+            batches[version].append(f"route add {network} dev {relay}")
+
+    for version, lines in batches.items():
+        if lines:
+            plan.append((['ip', f'-{version}', '-batch', '-'], '\n'.join(lines) + '\n', True))
+
+    # Let replies to fwmark'd (tunnel) packets pass reverse path filtering
+    if 4 in defaults:
+        plan.append((['sysctl', '-q', 'net.ipv4.conf.all.src_valid_mark=1'], None, True))
+
+    if interface.get("dns"):
+        nameservers = ''.join(f"nameserver {server}\n" for server in interface["dns"])
+        plan.append((['resolvconf', '-a', f'tun.{relay}', '-m', '0', '-x'], nameservers, True))
+
+    return plan
+
+def down_plan(relay):
+    """
+    Returns the (argv, stdin, check) commands that undo `up_plan`. Only deleting the
+    link must succeed, the policy rules and DNS entry may already be gone.
+    """
+    rules = (
+        f"rule delete table {FWMARK}\n"
+        "rule delete table main suppress_prefixlength 0\n"
+    )
+    return [
+        (['ip', '-force', '-4', '-batch', '-'], rules, False),
+        (['ip', '-force', '-6', '-batch', '-'], rules, False),
+        (['ip', 'link', 'delete', 'dev', relay], None, True),   # drops addresses and routes with it
+        (['resolvconf', '-d', f'tun.{relay}', '-f'], None, False),
+    ]
+
+
+## ------------- EXECUTION ------------- ##
+
+def _run(plan, strict=True):
+    """Runs plan commands under sudo, returns their combined output. Raises if a checked command fails (strict only)."""
+    output = []
+    for argv, stdin, check in plan:
+        result = subprocess.run(
+            ['sudo', *argv], input=stdin, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+        )
+        output.append(f"[#] {' '.join(argv)}\n{result.stdout}")
+        if strict and check and result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, argv, output=''.join(output))
+    return ''.join(output)
+
+def with_endpoint_host(endpoint, host):
+    """Returns `endpoint` (host:port or [host]:port) with its host replaced by `host`."""
+    port = endpoint.rsplit(':', 1)[1]
+    return f"[{host}]:{port}" if ':' in host else f"{host}:{port}"
+
+def up(relay, endpoint_host=None):
+    """
+    Brings `relay` up from its config, rolling back on failure. Returns the command log.
+    `endpoint_host` replaces the host of the peer endpoints, keeping their ports.
+    """
+    config = parse_config(read_config(relay))
+    if endpoint_host:
+        for peer in config["peers"]:
+            if "endpoint" in peer:
+                peer["endpoint"] = with_endpoint_host(peer["endpoint"], endpoint_host)
+    plan = up_plan(relay, config)
+    try:
+        return _run(plan)
+    except subprocess.CalledProcessError:
+        _run(down_plan(relay), strict=False)
+        raise
+
+def down(relay):
+    """
+    Tears `relay` down. Returns the command log. The config is parsed first so configs
+    that `up` hands to wg-quick (hooks, e.g. kill-switch PreDown rules) raise
+    `UnsupportedConfig` here too and are torn down by wg-quick as well. A config that is
+    missing or unreadable does not block the teardown.
+    """
+    try:
+        parse_config(read_config(relay))
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return _run(down_plan(relay))